@@ -13,7 +13,9 @@ sm = SurfaceMesh(filename = filename)
 
 m = Material('AISI 6000 steel',
              E=207*10**9,
+             poisson=0.29,
              Cp=0.475*10**-3,
+             density=7850,
              k=46.6)
 
 em = Part(surface_mesh=sm, material=m)
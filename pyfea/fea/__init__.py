@@ -1,4 +1,13 @@
 import pyfea.fea.materials
+import pyfea.fea.topology
+import pyfea.fea.metrics
+import pyfea.fea.quality
+import pyfea.fea.smoothing
+import pyfea.fea.solvers
+import pyfea.fea.fem
+import pyfea.fea.spatial
+import pyfea.fea.partition
 import pyfea.fea.geometry
+import pyfea.fea.fileformat
 import pyfea.fea.simulation
 #import pyfea.fea.aerosandbox_geo
\ No newline at end of file
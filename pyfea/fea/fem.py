@@ -0,0 +1,706 @@
+# -*- coding: utf-8 -*-
+"""
+Linear (P1) tetrahedral finite elements. Element matrices are computed for
+all tets at once from a TetGeometry and summed into scipy.sparse matrices.
+"""
+
+import numpy as np
+
+def material_index(materials):
+    """
+    Returns the distinct Material instances of per-tet materials and the
+    index of each tet's material among them.
+    """
+
+    materials = np.asarray(materials, dtype=object)
+
+    ids = np.array([id(m) for m in materials], dtype=np.int64)
+    _, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+
+    return materials[first], inverse.ravel()
+
+def material_property(materials, name, default=None, index=None):
+    """
+    Returns the per-tet values of a material property from the per-tet
+    Material instances (looked up once per distinct material, index is a
+    precomputed material_index).
+
+    Materials without the property use default if given, otherwise a
+    ValueError is raised.
+    """
+
+    distinct, inverse = material_index(materials) if index is None else index
+
+    values = []
+    for m in distinct:
+        value = getattr(m, name, None)
+
+        if value is None:
+            if default is None:
+                raise ValueError('Material property "' + name + '" is not '
+                                 'defined for ' + str(m.material))
+            print('WARNING: material property "' + name + '" is not defined '
+                  'for ' + str(m.material) + ', using ' + str(default))
+            value = default
+
+        values.append(value)
+
+    return np.asarray(values, dtype=np.float64)[inverse]
+
+def element_dofs(tets, dofs_per_node=1):
+    """
+    Returns the (n, 4*dofs_per_node) global degrees of freedom of each tet,
+    node-major (node*dofs_per_node + component).
+    """
+
+    tets = np.asarray(tets, dtype=np.int64)
+    d = np.arange(dofs_per_node)
+
+    return (tets[:, :, None]*dofs_per_node + d).reshape(len(tets), -1)
+
+def assemble(tets, n_nodes, element_matrices, dofs_per_node=1):
+    """
+    Sums (n, m, m) element matrices (m = 4*dofs_per_node, ordered as
+    element_dofs) into a CSR matrix over all degrees of freedom.
+    """
+
+    from scipy.sparse import coo_matrix
+
+    dofs = element_dofs(tets, dofs_per_node)
+    m = dofs.shape[1]
+
+    rows = np.repeat(dofs, m, axis=1).ravel()
+    cols = np.tile(dofs, (1, m)).ravel()
+
+    n = n_nodes*dofs_per_node
+    matrix = coo_matrix((np.asarray(element_matrices).ravel(), (rows, cols)),
+                        shape=(n, n))
+
+    #duplicates are summed by the conversion
+    return matrix.tocsr()
+
+def conductivity_matrices(geometry, k):
+    """
+    Returns the (n, 4, 4) element conductivity matrices k |V| G G^T, G the
+    (4, 3) shape function gradients of each tet.
+    """
+
+    G = geometry.gradients
+    scale = np.asarray(k)*np.abs(geometry.volumes)
+
+    return scale[:, None, None]*np.einsum('nik,njk->nij', G, G)
+
+def capacity_matrices(geometry, c):
+    """
+    Returns the (n, 4, 4) consistent element capacity (mass) matrices
+    c |V| (1 + delta_ij) / 20.
+    """
+
+    scale = np.asarray(c)*np.abs(geometry.volumes)/20.
+
+    return scale[:, None, None]*(np.ones((4, 4)) + np.eye(4))
+
+def conductivity_matrix(geometry, n_nodes, k):
+    """
+    Returns the assembled (n_nodes, n_nodes) conductivity matrix.
+    """
+
+    return assemble(geometry.tets, n_nodes, conductivity_matrices(geometry, k))
+
+def conductivity_operator(geometry, n_nodes, k, index, chunk_size=2**16):
+    """
+    Returns the matrix-free conductivity operator (see ElementOperator) of
+    the conductivities k of m distinct materials, index being the material
+    of every tet.
+    """
+
+    D = np.asarray(k, dtype=np.float64)[:, None, None]*np.eye(3)
+
+    return ElementOperator(geometry, n_nodes, D, index, 1, chunk_size)
+
+def capacity_matrix(geometry, n_nodes, c, lumped=True):
+    """
+    Returns the assembled capacity matrix, as the (n_nodes,) diagonal if
+    lumped (c |V| / 4 to each node of a tet, summed over the geometry
+    chunks) or as a CSR matrix.
+    """
+
+    if lumped:
+        c = np.broadcast_to(np.asarray(c, dtype=np.float64), (geometry.n_tets,))
+
+        diagonal = np.zeros(n_nodes)
+        for chunk in geometry.chunks():
+            lump = c[chunk]*np.abs(geometry.volumes[chunk])/4.
+            diagonal += np.bincount(np.asarray(geometry.tets[chunk]).ravel(),
+                                    weights=np.repeat(lump, 4), minlength=n_nodes)
+        return diagonal
+
+    return assemble(geometry.tets, n_nodes, capacity_matrices(geometry, c))
+
+def strain_displacement(geometry, index=slice(None)):
+    """
+    Returns the (n, 6, 12) strain-displacement matrices B of the selected
+    tets: Voigt strains (xx, yy, zz, yz, xz, xy, engineering shears) from
+    the node-major displacements (node*3 + component).
+    """
+
+    return _strain_displacement(geometry.element_gradients(index)[1])
+
+def _strain_displacement(G):
+    """
+    Strain-displacement matrices of (n, 4, 3) shape function gradients.
+    """
+
+    gx, gy, gz = G[:, :, 0], G[:, :, 1], G[:, :, 2]
+
+    B = np.zeros((len(G), 6, 4, 3))
+    B[:, 0, :, 0] = gx
+    B[:, 1, :, 1] = gy
+    B[:, 2, :, 2] = gz
+    B[:, 3, :, 1], B[:, 3, :, 2] = gz, gy
+    B[:, 4, :, 0], B[:, 4, :, 2] = gz, gx
+    B[:, 5, :, 0], B[:, 5, :, 1] = gy, gx
+
+    return B.reshape(len(G), 6, 12)
+
+def elasticity_matrices(E, poisson):
+    """
+    Returns the (m, 6, 6) isotropic elasticity matrices D (Voigt notation,
+    engineering shears) of m Young's moduli and Poisson ratios.
+    """
+
+    E, poisson = np.atleast_1d(E).astype(np.float64), np.atleast_1d(poisson)
+
+    lame = E*poisson/((1 + poisson)*(1 - 2*poisson))
+    shear = E/(2*(1 + poisson))
+
+    D = np.zeros((len(E), 6, 6))
+    D[:, :3, :3] = lame[:, None, None]
+    D[:, [0, 1, 2], [0, 1, 2]] += 2*shear[:, None]
+    D[:, [3, 4, 5], [3, 4, 5]] = shear[:, None]
+
+    return D
+
+def stiffness_matrices(geometry, D, index=slice(None)):
+    """
+    Returns the (n, 12, 12) element stiffness matrices |V| B^T D B of the
+    selected tets, D being their (n, 6, 6) elasticity matrices.
+    """
+
+    B = strain_displacement(geometry, index)
+    volume = np.abs(geometry.volumes[index])
+
+    return volume[:, None, None]*(B.transpose(0, 2, 1) @ (D @ B))
+
+class BlockPattern:
+    """
+    Sparsity pattern of matrices assembled from tet element matrices with
+    dofs_per_node degrees of freedom per node, stored as (d, d) node blocks
+    (scipy BSR). The block of every (local row node, local column node)
+    pair of every tet is found once, so assembly is a scatter-add of
+    element matrices straight into the block data (in chunks of tets if
+    needed).
+    """
+
+    def __init__(self, tets, n_nodes, dofs_per_node=3, chunk_size=2**18):
+        """
+        Builds the node graph (with the diagonal) of the (n, 4) tets and the
+        (n, 16) block index of every element block.
+        """
+
+        from pyfea.fea.topology import node_adjacency
+
+        tets = np.asarray(tets, dtype=np.int64)
+        self.n_nodes = n_nodes
+        self.dofs_per_node = dofs_per_node
+
+        flat, row_splits = node_adjacency(tets, n_nodes)
+        rows = np.repeat(np.arange(n_nodes), np.diff(row_splits))
+
+        nodes = np.arange(n_nodes)
+        keys = np.sort(np.concatenate([rows*n_nodes + flat, nodes*n_nodes + nodes]))
+
+        self.indices = (keys % n_nodes).astype(np.int32)
+        self.indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n_nodes, minlength=n_nodes), out=self.indptr[1:])
+
+        dtype = np.int32 if len(keys) < 2**31 else np.int64
+        self.scatter = np.empty((len(tets), 16), dtype=dtype)
+
+        #bounded temporaries on large meshes
+        for start in range(0, len(tets), chunk_size):
+            chunk = tets[start:start + chunk_size]
+            pairs = chunk[:, :, None]*n_nodes + chunk[:, None, :]
+            self.scatter[start:start + chunk_size] = \
+                np.searchsorted(keys, pairs.reshape(len(chunk), 16))
+
+    @property
+    def n_blocks(self):
+        return len(self.indices)
+
+    def assemble(self, chunks):
+        """
+        Sums element matrices into a BSR matrix. chunks yields (index,
+        element_matrices) with index selecting tets (a slice or indices) and
+        (len(index), 4*d, 4*d) matrices, node-major.
+        """
+
+        from scipy.sparse import bsr_matrix
+
+        d = self.dofs_per_node
+        data = np.zeros((self.n_blocks, d*d))
+
+        for index, matrices in chunks:
+            #(n, 4, d, 4, d) -> (n, 4, 4, d*d) node blocks
+            blocks = matrices.reshape(-1, 4, d, 4, d).transpose(0, 1, 3, 2, 4)
+            blocks = blocks.reshape(-1, 16, d*d)
+
+            target = self.scatter[index].ravel()
+            for k in range(d*d):
+                data[:, k] += np.bincount(target, weights=blocks[:, :, k].ravel(),
+                                          minlength=self.n_blocks)
+
+        n = self.n_nodes*d
+        return bsr_matrix((data.reshape(-1, d, d), self.indices, self.indptr),
+                          shape=(n, n))
+
+def von_mises(stress):
+    """
+    Returns the von Mises stress of (n, 6) Voigt stresses.
+    """
+
+    s = stress
+    return np.sqrt(0.5*((s[:, 0] - s[:, 1])**2 + (s[:, 1] - s[:, 2])**2
+                        + (s[:, 2] - s[:, 0])**2)
+                   + 3*(s[:, 3]**2 + s[:, 4]**2 + s[:, 5]**2))
+
+def max_shear(stress):
+    """
+    Returns the maximum shear stress (half the spread of the principal
+    stresses) of (n, 6) Voigt stresses.
+    """
+
+    s = stress
+    tensor = np.stack([s[:, [0, 5, 4]], s[:, [5, 1, 3]], s[:, [4, 3, 2]]], axis=1)
+    principal = np.linalg.eigvalsh(tensor)
+
+    return (principal[:, -1] - principal[:, 0])/2.
+
+def stable_timestep(matrix, capacity, safety=0.9):
+    """
+    Returns the largest stable forward Euler step 2/lambda_max of
+    capacity^-1 matrix (lumped capacity), with lambda_max bounded by the
+    Gershgorin row sums max_i sum_j |K_ij| / c_i, times safety (element
+    row sums for matrix-free operators).
+    """
+
+    capacity = np.asarray(capacity)
+
+    if hasattr(matrix, 'abs_row_sums'):
+        rows = matrix.abs_row_sums()
+    else:
+        rows = np.asarray(abs(matrix).sum(axis=1)).ravel()
+
+    used = capacity > 0
+    if not np.any(used):
+        return np.inf
+
+    bound = (rows[used]/capacity[used]).max()
+
+    return safety*2./bound if bound > 0 else np.inf
+
+def nodal_average(tets, values, n_nodes, weights=None, chunk_size=None):
+    """
+    Returns the mean of per-tet values over the tets around each node,
+    weighted by |weights| (eg. signed volumes), nodes without tets get 0.
+    Tets are read in chunks of chunk_size if given.
+    """
+
+    values = np.asarray(values)
+    chunk_size = chunk_size or max(len(values), 1)
+
+    total = np.zeros(n_nodes)
+    count = np.zeros(n_nodes)
+
+    for start in range(0, len(values), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        nodes = np.asarray(tets[chunk]).ravel()
+        w = np.ones(len(values[chunk])) if weights is None \
+            else np.abs(np.asarray(weights[chunk]))
+
+        total += np.bincount(nodes, weights=np.repeat(w*values[chunk], 4),
+                             minlength=n_nodes)
+        count += np.bincount(nodes, weights=np.repeat(w, 4), minlength=n_nodes)
+
+    return np.divide(total, count, out=np.zeros(n_nodes), where=count > 0)
+
+def element_average(tets, nodal, chunk_size=None):
+    """
+    Returns the mean of the nodal values of each tet (gathered in chunks of
+    chunk_size tets if given).
+    """
+
+    nodal = np.asarray(nodal)
+    chunk_size = chunk_size or max(len(tets), 1)
+
+    out = np.empty((len(tets),) + nodal.shape[1:])
+    for start in range(0, len(tets), chunk_size):
+        out[start:start + chunk_size] = \
+            nodal[np.asarray(tets[start:start + chunk_size])].mean(axis=1)
+
+    return out
+
+class ThetaStepper:
+    """
+    Theta-method time integration of C dx/dt = -K x:
+
+    (C + theta dt K) x_new = (C - (1 - theta) dt K) x
+
+    theta = 0 is forward Euler (explicit, no solve with a lumped C), 1 is
+    backward Euler and 0.5 is Crank-Nicolson. The linear solver (sparse LU
+    by default, see pyfea.fea.solvers) is set up once for the system
+    matrix and reused for every step with the same dt, a new stepper is
+    needed when K or C change.
+
+    Crank-Nicolson flips the sign of stiff modes (amplification close to
+    -1 for large dt), which shows as oscillations of non-smooth data. The
+    first startup steps (and the first ones after restart) are taken as two
+    backward Euler half steps instead, which damp them (Rannacher
+    startup).
+    """
+
+    schemes = {'explicit': 0., 'backward_euler': 1., 'crank_nicolson': 0.5}
+
+    stiffness = None
+    capacity = None
+    theta = 1.
+
+    def __init__(self, stiffness, capacity, theta=1., solver=None, startup=0):
+        """
+        Wraps the (n, n) stiffness matrix K (sparse or a matrix-free
+        operator) and the capacity C, an (n,) lumped diagonal or an (n, n)
+        sparse matrix. theta is a number or a key of schemes, solver a
+        solver instance and startup the number of Rannacher startup steps
+        (implicit schemes with theta < 1 only).
+        """
+
+        from pyfea.fea.solvers import get_solver
+
+        self.stiffness = stiffness
+        self.capacity = capacity
+        self.theta = float(self.schemes.get(theta, theta))
+        self.solver = get_solver('lu') if solver is None else solver
+
+        self.lumped = np.ndim(capacity) == 1
+
+        #nodes without tets are kept as they are
+        diagonal = capacity if self.lumped else capacity.diagonal()
+        self.unused = diagonal <= 0
+
+        self.factorizations = 0
+        self._system = None
+
+        self.startup = startup if 0 < self.theta < 1 else 0
+        self.restart()
+
+    def restart(self):
+        """
+        Takes the next startup steps as backward Euler half steps again
+        (eg. after x was changed outside of the stepper).
+        """
+
+        self._startup_left = self.startup
+
+    def factorize(self, dt, theta=None):
+        """
+        Returns the solver set up for C + theta dt K (theta of the scheme by
+        default), only set up again when dt or theta differ from the last
+        ones.
+        """
+
+        from scipy.sparse import diags
+
+        if theta is None: theta = self.theta
+
+        if self._system != (dt, theta):
+            if isinstance(self.stiffness, _Operator):
+                assert self.lumped, 'Matrix-free steps need a lumped capacity.'
+                system = ShiftedOperator(self.capacity + self.unused, self.stiffness,
+                                         theta*dt)
+            else:
+                capacity = diags(self.capacity) if self.lumped else self.capacity
+                system = (capacity + theta*dt*self.stiffness
+                          + diags(self.unused.astype(np.float64))).tocsr()
+
+            self.solver.setup(system)
+            self._system = (dt, theta)
+            self.factorizations += 1
+
+        return self.solver
+
+    def step(self, x, dt):
+        """
+        Returns x advanced by one step of dt.
+        """
+
+        if self.lumped and self.theta == 0:
+            return x - dt*np.divide(self.stiffness @ x, self.capacity,
+                                    out=np.zeros_like(x), where=self.capacity > 0)
+
+        if self._startup_left > 0:
+            self._startup_left -= 1
+            return self._theta_step(self._theta_step(x, dt/2., 1.), dt/2., 1.)
+
+        return self._theta_step(x, dt, self.theta)
+
+    def _theta_step(self, x, dt, theta):
+        """
+        One implicit step of dt with the given theta.
+        """
+
+        if self.lumped:
+            rhs = self.capacity*x
+        else:
+            rhs = self.capacity @ x
+
+        if theta != 1:
+            rhs -= (1 - theta)*dt*(self.stiffness @ x)
+        rhs[self.unused] = x[self.unused]
+
+        return self.factorize(dt, theta).solve(rhs, x0=x)
+
+class _Operator:
+    """
+    Shared interface of the matrix-free operators: shape, dtype, matvec,
+    @ and diagonal, enough for the iterative solvers (scipy accepts any
+    object with shape and matvec) and the jacobi preconditioner.
+    """
+
+    dtype = np.dtype(np.float64)
+
+    def __matmul__(self, x):
+        x = np.asarray(x)
+        if x.ndim == 2:
+            return np.stack([self.matvec(column) for column in x.T], axis=1)
+        return self.matvec(x)
+
+    def aslinearoperator(self):
+        """
+        Returns the operator as a scipy LinearOperator.
+        """
+
+        from scipy.sparse.linalg import LinearOperator
+
+        return LinearOperator(self.shape, matvec=self.matvec, dtype=self.dtype)
+
+    def tocsc(self):
+        return self.tocsr().tocsc()
+
+class ElementOperator(_Operator):
+    """
+    Matrix-free operator A x = sum_e P_e^T |V_e| B_e^T D_e B_e P_e x, P_e
+    gathering the element dofs of x. Only one D per distinct material is
+    stored: volumes and shape function gradients G are computed chunk by
+    chunk from the nodes and tets (see TetGeometry.element_gradients, the
+    geometry tables are used if already built). Products are computed in
+    chunks of tets:
+
+    - dofs_per_node=1 (conduction, D = k I): f = |V| G D (G^T x_e)
+    - dofs_per_node=3 (linear elasticity): f = |V| G S, S the stress tensor
+      of D applied to the Voigt strain of grad u = x_e^T G
+
+    and scatter-added with bincount. Chunks cover few nodes on renumbered
+    meshes (see EntityMesh.renumber), which keeps the scatter cheap.
+    """
+
+    def __init__(self, geometry, n_nodes, D, index, dofs_per_node=1,
+                 chunk_size=2**16):
+        """
+        Wraps a TetGeometry with the (m, r, r) material matrices D and the
+        index of the material of every tet.
+        """
+
+        assert dofs_per_node in [1, 3], 'dofs_per_node must be 1 or 3'
+
+        self.geometry = geometry
+        self.tets = np.asarray(geometry.tets)
+        self.D = np.asarray(D, dtype=np.float64)
+        self.index = np.asarray(index)
+        self.dofs_per_node = dofs_per_node
+        self.chunk_size = chunk_size
+
+        self.n_nodes = n_nodes
+        n = n_nodes*dofs_per_node
+        self.shape = (n, n)
+
+    def _chunks(self):
+        n = len(self.tets)
+        for start in range(0, n, self.chunk_size):
+            yield slice(start, min(start + self.chunk_size, n))
+
+    def _B(self, G):
+        if self.dofs_per_node == 1:
+            return G.transpose(0, 2, 1)
+        return _strain_displacement(G)
+
+    def _scatter(self, out, tets, values):
+        """
+        Adds (n, 4, d) element values to the (n_nodes, d) out over the node
+        range of the chunk only.
+        """
+
+        low, high = tets.min(), tets.max() + 1
+        local = (tets - low).ravel()
+
+        for c in range(values.shape[2]):
+            out[low:high, c] += np.bincount(local, weights=values[:, :, c].ravel(),
+                                            minlength=high - low)
+
+    def _material(self, chunk, values):
+        """
+        Applies the material matrices to (n, r) values of a chunk.
+        """
+
+        if len(self.D) == 1:
+            return values @ self.D[0].T
+        return np.einsum('nrs,ns->nr', self.D[self.index[chunk]], values)
+
+    def _apply(self, chunk, x):
+        """
+        Returns the (n, 4, d) element products of the (n, 4, d) element
+        values x.
+        """
+
+        volume, G = self.geometry.element_gradients(chunk)
+
+        #(n, d, 3) gradient of the field
+        H = x.transpose(0, 2, 1) @ G
+
+        if self.dofs_per_node == 1:
+            flux = self._material(chunk, H[:, 0])
+            S = flux[:, :, None]
+        else:
+            strain = np.stack([H[:, 0, 0], H[:, 1, 1], H[:, 2, 2],
+                               H[:, 1, 2] + H[:, 2, 1],
+                               H[:, 0, 2] + H[:, 2, 0],
+                               H[:, 0, 1] + H[:, 1, 0]], axis=1)
+            stress = self._material(chunk, strain)
+            S = stress[:, [[0, 5, 4], [5, 1, 3], [4, 3, 2]]]
+
+        return volume[:, None, None]*(G @ S)
+
+    def _element_matrices(self, chunk):
+        volume, G = self.geometry.element_gradients(chunk)
+        B = self._B(G)
+
+        return volume[:, None, None] \
+               * (B.transpose(0, 2, 1) @ (self.D[self.index[chunk]] @ B))
+
+    def matvec(self, x):
+        d = self.dofs_per_node
+        x = np.asarray(x, dtype=np.float64).reshape(-1, d)
+        y = np.zeros((self.n_nodes, d))
+
+        for chunk in self._chunks():
+            tets = self.tets[chunk]
+            self._scatter(y, tets, self._apply(chunk, x[tets]))
+
+        return y.ravel()
+
+    def diagonal(self):
+        """
+        Returns the diagonal of the operator.
+        """
+
+        d = self.dofs_per_node
+        out = np.zeros((self.n_nodes, d))
+
+        for chunk in self._chunks():
+            volume, G = self.geometry.element_gradients(chunk)
+            B = self._B(G)
+
+            DB = self.D[self.index[chunk]] @ B
+            values = np.einsum('nrm,nrm->nm', B, DB)*volume[:, None]
+
+            self._scatter(out, self.tets[chunk], values.reshape(-1, 4, d))
+
+        return out.ravel()
+
+    def abs_row_sums(self):
+        """
+        Returns an upper bound of the row sums of |A| (sums of the element
+        rows of |A_e|), for Gershgorin bounds.
+        """
+
+        d = self.dofs_per_node
+        out = np.zeros((self.n_nodes, d))
+
+        for chunk in self._chunks():
+            values = np.abs(self._element_matrices(chunk)).sum(axis=2)
+            self._scatter(out, self.tets[chunk], values.reshape(-1, 4, d))
+
+        return out.ravel()
+
+    def tocsr(self):
+        """
+        Assembles the operator as a CSR matrix (for direct solvers and
+        preconditioners needing the entries, uses the memory matrix-free
+        mode saves).
+        """
+
+        print('WARNING: assembling a matrix-free operator')
+
+        if self.dofs_per_node == 1:
+            return assemble(self.tets, self.n_nodes, np.concatenate(
+                [self._element_matrices(chunk) for chunk in self._chunks()]))
+
+        pattern = BlockPattern(self.tets, self.n_nodes, self.dofs_per_node,
+                               self.chunk_size)
+        return pattern.assemble((chunk, self._element_matrices(chunk))
+                                for chunk in self._chunks()).tocsr()
+
+class ShiftedOperator(_Operator):
+    """
+    Matrix-free diag(shift) + scale*A of an operator A, eg. the implicit
+    system C + theta dt K with a lumped capacity C.
+    """
+
+    def __init__(self, shift, operator, scale=1.):
+        self.shift = np.asarray(shift, dtype=np.float64)
+        self.operator = operator
+        self.scale = scale
+        self.shape = operator.shape
+
+    def matvec(self, x):
+        x = np.asarray(x, dtype=np.float64).ravel()
+        return self.shift*x + self.scale*self.operator.matvec(x)
+
+    def diagonal(self):
+        return self.shift + self.scale*self.operator.diagonal()
+
+    def tocsr(self):
+        from scipy.sparse import diags
+
+        return (diags(self.shift) + self.scale*self.operator.tocsr()).tocsr()
+
+class RestrictedOperator(_Operator):
+    """
+    Matrix-free A[free][:, free] of an operator A (the other dofs are 0,
+    eg. fixed displacements).
+    """
+
+    def __init__(self, operator, free):
+        self.operator = operator
+        self.free = np.asarray(free)
+        self.shape = (len(self.free), len(self.free))
+
+    def matvec(self, x):
+        full = np.zeros(self.operator.shape[1])
+        full[self.free] = np.asarray(x, dtype=np.float64).ravel()
+        return self.operator.matvec(full)[self.free]
+
+    def diagonal(self):
+        return self.operator.diagonal()[self.free]
+
+    def tocsr(self):
+        return self.operator.tocsr()[self.free][:, self.free]
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Native pyfea mesh container. A small JSON header followed by raw,
+64-byte aligned arrays so every array can be opened with np.memmap and only
+the pages that are actually used get read.
+
+Layout::
+
+    b'PYFEAMSH' | uint32 version | uint32 0 | uint64 header length
+    JSON header (array dtypes, shapes, offsets and attributes)
+    padding, then the arrays (offsets relative to the start of the data)
+"""
+
+import json
+import numpy as np
+
+from pyfea.fea.materials import Material
+
+MAGIC = b'PYFEAMSH'
+VERSION = 1
+ALIGNMENT = 64
+
+def _align(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+def write_arrays(filename, arrays, attrs=None):
+    """
+    Writes a dict of arrays (and JSON-serializable attributes) to a
+    container file.
+    """
+
+    arrays = {name: np.asarray(value) for name, value in arrays.items()}
+
+    table = {}
+    offset = 0
+    for name, arr in arrays.items():
+        table[name] = {'dtype': arr.dtype.str,
+                       'shape': list(arr.shape),
+                       'offset': offset}
+        offset = _align(offset + arr.nbytes)
+
+    header = json.dumps({'arrays': table, 'attrs': attrs or {}}).encode()
+    start = _align(len(MAGIC) + 16 + len(header))
+
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.array([VERSION, 0], dtype='<u4').tobytes())
+        f.write(np.array([len(header)], dtype='<u8').tobytes())
+        f.write(header)
+
+        for name, arr in arrays.items():
+            f.seek(start + table[name]['offset'])
+            np.ascontiguousarray(arr).tofile(f)
+
+        #make sure trailing padding exists so every memmap fits
+        f.truncate(start + offset)
+
+    return filename
+
+def read_arrays(filename, mmap_mode='c'):
+    """
+    Opens a container file, returns (arrays, attrs). Arrays are np.memmap
+    instances unless mmap_mode is None (read into memory).
+
+    The default copy-on-write mode allows in-place edits without touching
+    the file.
+    """
+
+    with open(filename, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC, 'not a pyfea mesh file: ' + str(filename)
+        version, _ = np.frombuffer(f.read(8), dtype='<u4')
+        assert version <= VERSION, 'unsupported pyfea mesh file version: ' + str(version)
+        length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(length).decode())
+
+        start = _align(len(MAGIC) + 16 + length)
+
+        arrays = {}
+        for name, info in header['arrays'].items():
+            dtype = np.dtype(info['dtype'])
+            shape = tuple(info['shape'])
+
+            if mmap_mode and int(np.prod(shape)) > 0:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode=mmap_mode,
+                                         offset=start + info['offset'],
+                                         shape=shape)
+            else:
+                f.seek(start + info['offset'])
+                arrays[name] = np.fromfile(f, dtype=dtype,
+                                           count=int(np.prod(shape))).reshape(shape)
+
+    return arrays, header['attrs']
+
+def _encode_material(material):
+    """
+    Converts a material to something JSON can store.
+    """
+
+    if isinstance(material, Material):
+        props = {name: (value.item() if hasattr(value, 'item') else value)
+                 for name, value in material.__dict__.items()}
+        return {'__material__': props}
+    return material
+
+def _decode_material(data):
+    """
+    Inverse of _encode_material.
+    """
+
+    if isinstance(data, dict) and '__material__' in data:
+        props = dict(data['__material__'])
+        return Material(props.pop('material'), props.pop('mat_type', 'solid'), **props)
+    return data
+
+def save(entity, filename):
+    """
+    Saves an EntityMesh, Part or Assembly (nodes, tets, topology,
+    renumbering permutations and their inverses and, for assemblies, part
+    offsets and materials).
+    """
+
+    from pyfea.fea.geometry import Part, Assembly
+
+    topology = entity.topology
+    topology.tet_to_tet
+
+    arrays = {'nodes': entity.nodes, 'tets': entity.tets}
+    arrays.update({'topology_' + name: value for name, value
+                   in topology.to_arrays().items()})
+
+    for name in ['node_permutation', 'node_inverse',
+                 'tet_permutation', 'tet_inverse']:
+        if getattr(entity, name) is not None:
+            arrays[name] = getattr(entity, name)
+
+    attrs = {'type': type(entity).__name__}
+
+    if isinstance(entity, Part):
+        attrs['name'] = entity.name
+        attrs['material'] = _encode_material(entity.material)
+
+    if isinstance(entity, Assembly):
+        #parts are contiguous, counted from tetpart as welding may have
+        #removed collapsed tets
+        if entity.tetpart is not None:
+            counts = np.bincount(entity.tetpart, minlength=len(entity.parts))
+        else:
+            counts = [len(part.tets) for part in entity.parts]
+        arrays['part_offsets'] = np.cumsum(np.r_[0, counts])
+        if entity.tetpart is not None:
+            arrays['tetpart'] = entity.tetpart
+        if entity.node_map is not None:
+            arrays['node_map'] = entity.node_map
+        if entity.interfaces is not None:
+            arrays['interface_faces'] = entity.interfaces['faces']
+            arrays['interface_tets'] = entity.interfaces['tets']
+
+        attrs['source_file'] = entity.source_file
+        attrs['parts'] = [{'name': part.name,
+                           'material': _encode_material(part.material)}
+                          for part in entity.parts]
+
+    return write_arrays(filename, arrays, attrs)
+
+def load(filename, mmap_mode='c'):
+    """
+    Loads a mesh saved with save(), arrays are memory-mapped.
+
+    Parts of a loaded Assembly are zero-copy views: their tets are slices of
+    the assembly tets and they share the assembly nodes. Per-tet materials
+    are expanded from the part materials on first access (see
+    Assembly.materials).
+    """
+
+    from pyfea.fea.geometry import EntityMesh, Part, Assembly
+    from pyfea.fea.topology import MeshTopology
+
+    arrays, attrs = read_arrays(filename, mmap_mode=mmap_mode)
+    nodes, tets = arrays['nodes'], arrays['tets']
+
+    if attrs['type'] == 'Assembly':
+        offsets = arrays['part_offsets']
+
+        parts = []
+        for i, info in enumerate(attrs['parts']):
+            part = Part(material=_decode_material(info['material']))
+            part.name = info['name']
+            part.add_geometry(nodes, tets[offsets[i]:offsets[i+1]])
+            parts.append(part)
+
+        entity = Assembly(parts, auto_unify_mesh=False)
+        entity.add_geometry(nodes, tets)
+        entity.source_file = attrs['source_file']
+        entity.tetpart = arrays['tetpart'] if 'tetpart' in arrays \
+                         else np.repeat(np.arange(len(parts)), np.diff(offsets))
+        entity.node_map = arrays.get('node_map')
+        if 'interface_faces' in arrays:
+            entity.interfaces = {'faces': arrays['interface_faces'],
+                                 'tets': arrays['interface_tets']}
+
+    elif attrs['type'] == 'Part':
+        entity = Part(material=_decode_material(attrs['material']))
+        entity.name = attrs['name']
+        entity.add_geometry(nodes, tets)
+
+    else:
+        entity = EntityMesh()
+        entity.add_geometry(nodes, tets)
+
+    #files without the inverses (older saves) sort the permutations
+    for kind in ['node', 'tet']:
+        if kind + '_permutation' in arrays:
+            permutation = arrays[kind + '_permutation']
+            inverse = arrays[kind + '_inverse'] if kind + '_inverse' in arrays \
+                      else np.argsort(permutation)
+            setattr(entity, kind + '_permutation', permutation)
+            setattr(entity, kind + '_inverse', inverse)
+
+    entity._topology = MeshTopology.from_arrays(
+            tets, len(nodes),
+            {name[len('topology_'):]: value for name, value
+             in arrays.items() if name.startswith('topology_')},
+            chunk_size=entity.chunk_size, directory=entity.storage_dir)
+
+    return entity
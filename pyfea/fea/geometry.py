@@ -4,10 +4,19 @@ import numpy as np
 import pyvista as pv
 import meshio
 from pyfea.tools.plotting import scatter3d
+from pyfea.fea.topology import MeshTopology, weld_nodes, shared_faces, \
+                                node_adjacency, rcm_order, signed_volumes
+from pyfea.fea.spatial import TetBVH, morton_codes, hilbert_codes
+from pyfea.fea.metrics import TetGeometry
 
+import os
 import tempfile
 
 class Tetrahedron:
+    """
+    Lightweight view of a single element of an EntityMesh, vertex indices and
+    the pointcloud are references to the mesh arrays (no copies).
+    """
     
     points = np.array([None]*4)
     pointcloud = None
@@ -25,13 +34,8 @@ class Tetrahedron:
         assert len(points) == 4, "Point array must be of length 4"
         assert max(points) < len(pointcloud), "Points must be within pointcloud length"
         
-#        if array_num:
-#            self.array_num = array_num
-#        elif entity_mesh:
-#            entity_mesh.tets.tolist().index(points.tolist())
-        
-        self.points = np.array(points)
-        self.pointcloud = np.array(pointcloud)[points]
+        self.points = np.asarray(points)
+        self.pointcloud = pointcloud
         self.entity_mesh = entity_mesh
         self.array_num = array_num
         
@@ -40,34 +44,40 @@ class Tetrahedron:
         Returns the 3d coordinates of the vertices of the tetrahedron.
         """
         
-        assert self.points
-        assert self.pointcloud
-        return np.array(self.pointcloud)[self.points]
+        assert self.points is not None
+        assert self.pointcloud is not None
+        return np.asarray(self.pointcloud)[self.points]
         
     def get_cog(self):
         """
         Returns the averages of the vertices.
         """
-        return np.mean(self.get_coords())
+        return np.mean(self.get_coords(), axis=0)
     
     def get_neighbors(self, tets=None):
         """
         Finds neighboring tetrahedrons given access to a list of potential
-        neighbors.
+        neighbors (candidates come from the mesh BVH when no list is given).
         """
         
-        #TODO: Implement axis aligned bounding boxes to speed up!!!
-        
         #make sure the tet has access to the list of possible neighbors
         assert tets is not None or \
                (isinstance(self.entity_mesh, EntityMesh)
                 and self.entity_mesh.tets is not None), \
                'Tetrahedron needs access to tets list (via argument or Tetrahedron.entity_mesh)'
-               
-        #vectorized neighbor finder
-        arr = np.concatenate((np.tile(self.points, (len(tets), 1)), tets), axis=1)
-        check = np.apply_along_axis(lambda x: len(set(x)) == 5, 1, arr)
-        self.neighbors = np.nonzero(check)
+        
+        if tets is None:
+            #only tets with overlapping bounding boxes can share a face
+            coords = self.get_coords()
+            candidates, _ = self.entity_mesh.bvh.query_box(coords.min(axis=0),
+                                                           coords.max(axis=0))
+            tets = self.entity_mesh.tets
+        else:
+            candidates = np.arange(len(tets))
+            
+        #vectorized neighbor finder (exactly 3 shared nodes)
+        shared = np.isin(np.asarray(tets)[candidates], self.points).sum(axis=1)
+        self.neighbors = (np.sort(candidates[shared == 3]),)
         
         return self.neighbors
     
@@ -111,6 +121,68 @@ class Tetrahedron:
 #        
 #        return plotter
     
+class TetrahedronArray:
+    """
+    Array-backed element container. Reads the tets and nodes of its
+    EntityMesh directly, per-element Tetrahedron views are only created on
+    access and per-element geometry is computed in batches.
+    """
+    
+    entity_mesh = None
+    
+    def __init__(self, entity_mesh):
+        """
+        Wraps the arrays of an EntityMesh (nothing is copied).
+        """
+        
+        self.entity_mesh = entity_mesh
+        
+    def __len__(self):
+        tets = self.entity_mesh.tets
+        return 0 if tets is None else len(tets)
+    
+    def __getitem__(self, index):
+        """
+        Returns a Tetrahedron view (or a list of views for slices/arrays).
+        """
+        
+        if isinstance(index, (int, np.integer)):
+            if index < 0: index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError('element index out of range')
+            
+            mesh = self.entity_mesh
+            return Tetrahedron(mesh.tets[index], mesh.nodes, mesh, int(index))
+        
+        return [self[i] for i in np.arange(len(self))[index]]
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+            
+    def get_coords(self, index=slice(None)):
+        """
+        Returns the (n, 4, 3) vertex coordinates of the selected elements.
+        """
+        
+        mesh = self.entity_mesh
+        return np.asarray(mesh.nodes)[np.asarray(mesh.tets)[index]]
+    
+    def get_cog(self, index=slice(None)):
+        """
+        Returns the (n, 3) centroids of the selected elements.
+        """
+        
+        return self.entity_mesh.geometry.centroids[index]
+    
+    def get_volume(self, index=slice(None)):
+        """
+        Returns the signed volumes of the selected elements (positive for
+        right-handed vertex ordering).
+        """
+        
+        return self.entity_mesh.geometry.volumes[index]
+    
 class EntityMesh:
     """
     Class defining the 3d geometry of an object.
@@ -121,14 +193,29 @@ class EntityMesh:
     tets = None
     
     elements    = []
-    adjacent    = []
-    adjacent_tf = []
     
-    _adjacent_flat        = []
-    _adjacent_count       = []
-    _adjacent_cell_starts = []
-    _adjacent_row_splits  = []
-                
+    #cached data derived from nodes/tets, dropped when either is reassigned
+    _topology = None
+    _bvh = None
+    _boundary = None
+    _geometry = None
+    _cached_attributes = ['_topology', '_bvh', '_boundary', '_geometry']
+    
+    #out-of-core storage (see EntityMesh.to_out_of_core)
+    chunk_size  = None
+    storage_dir = None
+    fields      = None
+    
+    #renumbering (new index -> original index, and inverse)
+    node_permutation = None
+    node_inverse     = None
+    tet_permutation  = None
+    tet_inverse      = None
+    
+    #per-tet attributes permuted along with the tets
+    _tet_attributes = ['materials']
+    
+    partitioning = None
     
     surface_mesh = None
     
@@ -140,18 +227,139 @@ class EntityMesh:
             Exception('surface_mesh is of type: ' + str(type(surface_mesh)))
         if surface_mesh:
             self.surface_mesh = surface_mesh
+            
+    def __setattr__(self, name, value):
+        """
+        Wrapper to invalidate cached mesh data when nodes or tets change.
+        """
+        
+        if name in ['nodes', 'tets']:
+            self.invalidate()
+        super(EntityMesh, self).__setattr__(name, value)
+        
+    def invalidate(self):
+        """
+        Drops cached topology/geometry (call after editing nodes or tets in
+        place).
+        """
+        
+        for name in self._cached_attributes:
+            self.__dict__.pop(name, None)
+            
+    @property
+    def topology(self):
+        """
+        MeshTopology of the tets (built on first access).
+        """
+        
+        if self._topology is None:
+            n_nodes = None if self.nodes is None else len(self.nodes)
+            self._topology = MeshTopology(self.tets, n_nodes,
+                                          chunk_size=self.chunk_size,
+                                          directory=self.storage_dir)
+        return self._topology
+    
+    @property
+    def bvh(self):
+        """
+        TetBVH spatial index of the tets (built on first access), for point
+        location, box, ray and nearest element queries.
+        """
+        
+        if self._bvh is None:
+            self._bvh = TetBVH(self.nodes, self.tets)
+        return self._bvh
+    
+    @property
+    def geometry(self):
+        """
+        TetGeometry table (volumes, centroids, face areas and normals,
+        inscribed radii, shape function gradients), built on first access.
+        Call invalidate() after moving nodes in place.
+        
+        Out-of-core meshes build it chunk by chunk into geometry_<name>.npy
+        memmaps in the storage directory.
+        """
+        
+        if self._geometry is None:
+            allocate = None
+            if self.storage_dir:
+                from numpy.lib.format import open_memmap
+                
+                def allocate(name, shape, dtype):
+                    path = os.path.join(self.storage_dir, 'geometry_' + name + '.npy')
+                    return open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+                
+            self._geometry = TetGeometry(self.nodes, self.tets,
+                                         chunk_size=self.chunk_size,
+                                         allocate=allocate)
+        return self._geometry
+    
+    @property
+    def boundary(self):
+        """
+        Outer surface of the tet mesh (built on first access), a dict of:
+        
+        - faces: (m, 3) face nodes, ordered so normals point outwards
+        - tets: owner tet of each face
+        - local: index of the face in its owner (opposite vertex local)
+        - nodes: unique nodes on the surface
+        """
+        
+        if self._boundary is None:
+            topology = self.topology
+            
+            faces = np.array(topology.face_nodes[topology.boundary_faces])
+            tets = np.asarray(topology.boundary_tets)
+            
+            #faces follow TET_FACES, flip those of inverted tets
+            inverted = signed_volumes(self.nodes, np.asarray(self.tets)[tets]) < 0
+            faces[inverted] = faces[inverted][:, ::-1]
+            
+            self._boundary = {'faces': faces,
+                              'tets': tets,
+                              'local': topology.boundary_local,
+                              'nodes': np.unique(faces)}
+        return self._boundary
+    
+    def export_surface(self):
+        """
+        Returns the boundary surface as a pyvista PolyData (cell i is the
+        face of tet boundary['tets'][i]).
+        """
+        
+        faces = self.boundary['faces']
+        cells = np.hstack([np.full((len(faces), 1), 3), faces]).ravel()
+        
+        return pv.PolyData(np.asarray(self.nodes), cells)
+    
+    @property
+    def adjacent(self):
+        """
+        List of face neighbors per tet (prefer topology.tet_to_tet).
+        """
+        
+        flat, row_splits = self.topology.tet_to_tet
+        return np.split(flat, row_splits[1:-1])
+    
+    @property
+    def _adjacent_flat(self):
+        return self.topology.tet_to_tet[0]
+    
+    @property
+    def _adjacent_row_splits(self):
+        return self.topology.tet_to_tet[1]
         
     def gen_elements(self, find_adjacent=False, force_regen=False):
         """
-        Generates Tetrahedron instances.
+        Generates the element container (O(1), Tetrahedron instances are
+        views created on access).
         """
         
-        if force_regen == False and self.elements != []: return
+        if force_regen == False and isinstance(self.elements, TetrahedronArray) \
+            and self.elements.entity_mesh is self: return
         
-        self.elements = []
-        for row in self.tets:
-            tet = Tetrahedron(row, self.nodes, self)
-            self.elements.append(tet)
+        self.elements = TetrahedronArray(self)
             
         if find_adjacent: self.get_adjacent()
             
@@ -161,19 +369,309 @@ class EntityMesh:
         interfaces).
         """
         
-        assert np.array(nodes).shape[1] == 3, "nodes must be a numpy array with dims (*,3)"
-        assert np.array(tets).shape[1] == 4, "tets must be a numpy array with dims (*,4)"
+        assert np.shape(nodes)[1] == 3, "nodes must be a numpy array with dims (*,3)"
+        assert np.shape(tets)[1] == 4, "tets must be a numpy array with dims (*,4)"
         self.nodes = nodes
         self.tets = tets
         
         if autogen:
             self.gen_elements()
             
+    def to_out_of_core(self, directory=None, chunk_size=2**20):
+        """
+        Moves nodes and tets to disk-backed arrays (.npy memmaps in
+        directory, a temp directory by default). Topology, fields and
+        physics kernels then work in chunks of chunk_size tets so peak
+        memory is set by the chunk size rather than the mesh size.
+        """
+        
+        from numpy.lib.format import open_memmap
+        
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='pyfea_')
+        os.makedirs(directory, exist_ok=True)
+        
+        self.storage_dir = directory
+        self.chunk_size = chunk_size
+        
+        for name in ['nodes', 'tets']:
+            arr = getattr(self, name)
+            mm = open_memmap(os.path.join(directory, name + '.npy'), mode='w+',
+                             dtype=arr.dtype, shape=arr.shape)
+            for start in range(0, len(arr), chunk_size):
+                mm[start:start+chunk_size] = arr[start:start+chunk_size]
+            mm.flush()
+            setattr(self, name, mm)
+            
+    def new_field(self, name, dtype=np.float64, shape=(), fill=0):
+        """
+        Creates a per-tet array (disk-backed when out-of-core), stored in
+        EntityMesh.fields.
+        """
+        
+        if self.fields is None: self.fields = {}
+        
+        shape = (len(self.tets),) + tuple(shape)
+        
+        if self.storage_dir:
+            from numpy.lib.format import open_memmap
+            field = open_memmap(os.path.join(self.storage_dir, 'field_' + name + '.npy'),
+                                mode='w+', dtype=dtype, shape=shape)
+            for chunk in self.iter_chunks():
+                field[chunk] = fill
+        else:
+            field = np.full(shape, fill, dtype=dtype)
+            
+        self.fields[name] = field
+        return field
+    
+    def iter_chunks(self, chunk_size=None):
+        """
+        Yields slices over the tets of at most chunk_size (defaults to the
+        out-of-core chunk size, or all tets at once).
+        """
+        
+        n = len(self.tets)
+        chunk_size = chunk_size or self.chunk_size or max(n, 1)
+        
+        for start in range(0, n, chunk_size):
+            yield slice(start, min(start + chunk_size, n))
+            
+    def _node_order(self, method):
+        """
+        New to old node order for renumber.
+        """
+        
+        if method == 'rcm':
+            return rcm_order(node_adjacency(self.tets, len(self.nodes)))
+        elif method == 'hilbert':
+            return np.argsort(hilbert_codes(self.nodes), kind='stable')
+        elif method == 'morton':
+            return np.argsort(morton_codes(self.nodes), kind='stable')
+        
+        raise ValueError('Unknown renumbering method: ' + str(method))
+        
+    def _tet_order(self, method):
+        """
+        New to old tet order for renumber.
+        """
+        
+        if method == 'rcm':
+            return rcm_order(self.topology.tet_to_tet)
+        elif method == 'hilbert':
+            return np.argsort(hilbert_codes(self.geometry.centroids), kind='stable')
+        elif method == 'morton':
+            return np.argsort(morton_codes(self.geometry.centroids), kind='stable')
+        
+        raise ValueError('Unknown renumbering method: ' + str(method))
+        
+    def renumber(self, method='rcm', nodes=True, tets=True):
+        """
+        Reorders nodes and/or tets for memory locality: 'rcm' (reverse
+        Cuthill-McKee on the node and face graphs, smallest matrix
+        bandwidth), 'hilbert' or 'morton' (space-filling curve order).
+        
+        Should be done before creating a Simulation (its variables are
+        indexed by tet). Returns (node_order, tet_order), see permute.
+        """
+        
+        node_order = self._node_order(method) if nodes else None
+        tet_order = self._tet_order(method) if tets else None
+        
+        self.permute(node_order, tet_order)
+        
+        return node_order, tet_order
+    
+    def permute(self, node_order=None, tet_order=None):
+        """
+        Applies a renumbering (new index i is old index order[i]) to nodes,
+        tets, per-tet attributes, fields and the cached topology.
+        
+        The accumulated permutations from the original numbering are kept in
+        node_permutation/tet_permutation (inverses in node_inverse/
+        tet_inverse), see original_order.
+        """
+        
+        n_nodes, n_tets = len(self.nodes), len(self.tets)
+        
+        if node_order is None: node_order = np.arange(n_nodes)
+        if tet_order is None: tet_order = np.arange(n_tets)
+        
+        node_inverse = np.empty(n_nodes, dtype=np.int64)
+        node_inverse[node_order] = np.arange(n_nodes)
+        
+        tets = self._permuted('tets', self.tets, tet_order, node_inverse)
+        
+        topology = self._topology.permute(tets, node_order, tet_order) \
+                   if self._topology is not None else None
+        
+        self.nodes = self._permuted('nodes', self.nodes, node_order)
+        self.tets = tets
+        self._topology = topology
+        
+        for name in self._tet_attributes:
+            value = getattr(self, name, None)
+            if value is not None and len(value) == n_tets:
+                setattr(self, name, np.asarray(value)[tet_order])
+                
+        if self.fields:
+            for name, field in self.fields.items():
+                self.fields[name] = self._permuted('field_' + name, field, tet_order)
+                
+        #accumulate so the permutations always refer to the original order
+        if self.node_permutation is not None:
+            node_order = self.node_permutation[node_order]
+        if self.tet_permutation is not None:
+            tet_order = self.tet_permutation[tet_order]
+            
+        self.node_permutation = node_order
+        self.node_inverse = np.argsort(node_order)
+        self.tet_permutation = tet_order
+        self.tet_inverse = np.argsort(tet_order)
+        
+        return node_inverse
+    
+    def _permuted(self, name, array, order, values=None):
+        """
+        Returns array[order] (with entries mapped through values if given),
+        order may also select a subset.
+        Out-of-core arrays are written chunk by chunk to a new <name>.npy
+        memmap in the storage directory, replacing the old file.
+        """
+        
+        if not self.storage_dir:
+            out = np.asarray(array)[order]
+            return out if values is None else values[out].astype(out.dtype)
+        
+        from numpy.lib.format import open_memmap
+        
+        path = os.path.join(self.storage_dir, name + '.npy')
+        out = open_memmap(path + '.tmp', mode='w+', dtype=array.dtype,
+                          shape=(len(order),) + array.shape[1:])
+        
+        chunk_size = self.chunk_size or max(len(order), 1)
+        for start in range(0, len(order), chunk_size):
+            rows = np.asarray(array[order[start:start+chunk_size]])
+            out[start:start+chunk_size] = rows if values is None else values[rows]
+        out.flush()
+        
+        #the old memmap stays valid until released
+        os.replace(path + '.tmp', path)
+        return out
+    
+    def quality(self):
+        """
+        Returns a QualityReport (aspect ratio, radius ratio, dihedral angles
+        and signed volume of every tet, see pyfea.fea.quality).
+        """
+        
+        from pyfea.fea.quality import QualityReport
+        
+        return QualityReport(self.geometry)
+    
+    def _fixed_nodes(self):
+        """
+        Nodes smoothing must not move (the outer surface).
+        """
+        
+        return self.boundary['nodes']
+    
+    def smooth(self, iterations=10, method='optimize', relaxation=0.5,
+               fixed=None):
+        """
+        Improves element shapes by moving interior nodes, the boundary (and
+        any extra fixed node indices) stays in place:
+        
+        - 'laplacian': sparse neighbor averaging, moves that lower the
+          quality around a node are reverted
+        - 'optimize': gradient steps on the inverse mean ratio of the tets
+          around each node with a quality-guarded line search
+        
+        See pyfea.fea.smoothing. Returns the QualityReport of the result.
+        """
+        
+        from pyfea.fea import smoothing
+        
+        fixed_nodes = self._fixed_nodes()
+        if fixed is not None:
+            fixed_nodes = np.union1d(fixed_nodes, fixed)
+            
+        topology = self.topology
+        
+        if method == 'laplacian':
+            nodes = smoothing.smooth_laplacian(self.nodes, self.tets, fixed_nodes,
+                                               iterations=iterations,
+                                               relaxation=relaxation)
+        elif method == 'optimize':
+            nodes = smoothing.smooth_optimize(self.nodes, self.tets, fixed_nodes,
+                                              node_to_tet=topology.node_to_tet,
+                                              iterations=iterations,
+                                              relaxation=relaxation)
+        else:
+            raise ValueError('Unknown smoothing method: ' + str(method))
+            
+        #connectivity is unchanged, keep the topology
+        self.nodes = nodes
+        self._topology = topology
+        
+        return self.quality()
+    
+    def fix_orientation(self):
+        """
+        Reorders the vertices of inverted (negative volume) tets in place so
+        every tet is positively oriented. Returns the indices of the fixed
+        tets.
+        """
+        
+        from pyfea.fea.quality import fix_orientation
+        
+        inverted = fix_orientation(self.nodes, self.tets)
+        
+        if len(inverted):
+            self.invalidate()
+            
+        return inverted
+    
+    def partition(self, n_parts, method='inertial', refine=True,
+                  weights=None, max_imbalance=1.05):
+        """
+        Splits the tets into n_parts balanced subdomains by recursive
+        'coordinate' or 'inertial' bisection, refined on the face adjacency
+        graph (see pyfea.fea.partition). weights are optional per-tet costs.
+        
+        Returns a Partitioning (labels, interface/halo lists, submeshes with
+        local numbering), also kept as EntityMesh.partitioning.
+        """
+        
+        from pyfea.fea.partition import partition
+        
+        self.partitioning = partition(self.tets, self.geometry.centroids,
+                                      self.topology.tet_to_tet, n_parts,
+                                      method=method, refine=refine,
+                                      weights=weights,
+                                      max_imbalance=max_imbalance)
+        
+        return self.partitioning
+    
+    def original_order(self, values, kind='tets'):
+        """
+        Returns per-tet (or per-node with kind='nodes') values in the
+        numbering from before renumber/permute, eg. for output.
+        """
+        
+        inverse = self.tet_inverse if kind == 'tets' else self.node_inverse
+        if inverse is None: return values
+        
+        return np.asarray(values)[inverse]
+    
     def get_cog(self):
         """
-        Returns COG.
+        Returns COG (volume-weighted mean of the tet centroids).
         """
-        return np.mean(self.nodes[self.nodes])
+        
+        geometry = self.geometry
+        return np.average(geometry.centroids, axis=0,
+                          weights=np.abs(geometry.volumes))
             
     def set_surface_mesh(self, surface_mesh, autogen=True):
         """
@@ -212,26 +710,61 @@ class EntityMesh:
             ppb(i+1, len(self.elements),
                 prefix = 'Progress:', suffix = '',
                 length = 25, decimals = 4)
-        self.adjacent = adjacent
+        return adjacent
         
     def get_adjacent(self):
         """
-        WIP: Seems to work, but buggy, much faster though.
+        Finds face-adjacent tetrahedrons by pairing sorted tet faces,
+        O(n log n) and without tensorflow (see EntityMesh.topology).
         """
         
-        from pyfea.dev.tf_pyfea import adjacentfinder
+        return self.adjacent
+            
+    def weld_nodes(self, tolerance=None):
+        """
+        Merges duplicate nodes (within tolerance if specified) and remaps the
+        tets in bulk. Tolerance should stay well below the element size: tets
+        left with repeated nodes (zero volume) are removed along with their
+        per-tet attributes and fields.
         
-        adj = adjacentfinder(self.tets, self.nodes)
+        Returns the map from old to new node indices.
+        """
         
-        self.adjacent_tf = adj
-        self.adjacent = np.array(adj.to_list())
+        nodes, inverse = weld_nodes(self.nodes, tolerance)
+        tets = inverse[self.tets]
         
-        self._adjacent_flat = np.array([item for sublist in adj for item in sublist])
-        self._adjacent_count = np.array([len(l) for l in adj])
-        self._adjacent_cell_starts = np.insert(self._adjacent_count[:-1].cumsum(), 0, 0)
-        self._adjacent_row_splits = np.hstack((self._adjacent_cell_starts, len(self._adjacent_flat)))
+        collapsed = (tets[:, :, None] == tets[:, None, :]).sum(axis=(1, 2)) > 4
+        if collapsed.any():
+            print('WARNING: removed ' + str(collapsed.sum()) + ' tets collapsed '
+                  + 'while welding nodes, tolerance may be too large.')
+            
+            keep = np.nonzero(~collapsed)[0]
+            
+            for name in self._tet_attributes:
+                value = getattr(self, name, None)
+                if value is not None and len(value) == len(tets):
+                    setattr(self, name, np.asarray(value)[keep])
+                    
+            if self.fields:
+                for name, field in self.fields.items():
+                    self.fields[name] = self._permuted('field_' + name, field, keep)
+                    
+            tets = tets[keep]
         
-        return self.adjacent
+        self.nodes = nodes
+        self.tets = tets
+        
+        return inverse
+            
+    def save(self, filename):
+        """
+        Saves the mesh to the native pyfea format (see pyfea.fea.fileformat),
+        reopen it with pyfea.fea.fileformat.load.
+        """
+        
+        from pyfea.fea.fileformat import save
+        
+        return save(self, filename)
             
     vtk_filename = None
     def export_vtk(self, filename=None):
@@ -247,10 +780,12 @@ class EntityMesh:
         self.vtk_filename = filename
         return filename
         
-    #TODO: Fix this
     def merge(self, entities, include_self=True, autogen=True):
         """
-        Blindly merges 3d meshes. Intersections are left as-is.
+        Blindly merges 3d meshes in a single pass into preallocated arrays.
+        Intersections are left as-is (see Assembly.merge_faces).
+        
+        Cached adjacency of the merged meshes is rebased rather than rebuilt.
         """
         
         if isinstance(entities, EntityMesh): entities = [entities]
@@ -258,44 +793,39 @@ class EntityMesh:
         assert type(entities)==list
         assert all([isinstance(x, EntityMesh) for x in entities])
         
-        #add itself to the list
+        #keep own geometry first
         if include_self: 
-            entities + [self]
+            entities = [self] + entities
+        entities = [e for e in entities if e.tets is not None and len(e.tets) > 0]
+        
+        if not entities: return
+        
+        nodes_list = [np.asarray(e.nodes) for e in entities]
+        tets_list = [np.asarray(e.tets) for e in entities]
+        
+        node_offsets = np.cumsum([0] + [len(n) for n in nodes_list])
+        tet_offsets = np.cumsum([0] + [len(t) for t in tets_list])
+        
+        nodes = np.empty((node_offsets[-1], 3), dtype=np.result_type(*nodes_list))
+        tets = np.empty((tet_offsets[-1], 4), dtype=np.result_type(*tets_list))
         
         #TODO: should remesh with gmsh instead of just appending
-        for entity in entities:
-            if len(self.tets) > 0:
-                self.tets = np.vstack([self.tets, entity.tets+len(self.nodes)])
-            else:
-                self.tets = entity.tets
-                
-            if len(self.adjacent) > 0:
-                    
-                self.adjacent = np.vstack([self.adjacent, entity.adjacent+len(self.tets)])
-                self.adjacent_tf = np.vstack([self.adjacent_tf, entity.adjacent_tf+len(self.tets)])
-                
-                self._adjacent_flat=np.vstack([self._adjacent_flat, entity._adjacent_flat+len(self.tets)])
-                self._adjacent_count=np.vstack([self._adjacent_count, entity._adjacent_count])
-                self._adjacent_cell_starts=np.vstack([self._adjacent_cell_starts, entity._adjacent_cell_starts+len(self._adjacent_flat)])
-                self._adjacent_row_splits = np.vstack([self._adjacent_row_splits, entity._adjacent_row_splits+len(self._adjacent_flat)])
-            
-            else:
-                
-                self.adjacent=entity.adjacent
-                self.adjacent_tf=entity.adjacent_tf
-                
-                self._adjacent_flat=entity._adjacent_flat
-                self._adjacent_count=entity._adjacent_count
-                self._adjacent_cell_starts = entity._adjacent_cell_starts
-                self._adjacent_row_splits = entity._adjacent_row_splits
-                
-            if len(self.nodes) > 0:
-                self.nodes = np.vstack([self.nodes, entity.nodes])
-            else:
-                self.nodes = entity.nodes
-            
-#        self.nodes = np.vstack([x.nodes for x in entities])
-#        self.tets = np.vstack([x.tets for x in entities])
+        for i in range(len(entities)):
+            nodes[node_offsets[i]:node_offsets[i+1]] = nodes_list[i]
+            tets[tet_offsets[i]:tet_offsets[i+1]] = tets_list[i]
+            tets[tet_offsets[i]:tet_offsets[i+1]] += node_offsets[i]
+        
+        #read before reassigning nodes/tets drops our own cache
+        topologies = [e._topology for e in entities]
+        
+        self.nodes = nodes
+        self.tets = tets
+        
+        if all([t is not None and t.n_nodes == len(n) 
+                for t, n in zip(topologies, nodes_list)]):
+            self._topology = MeshTopology.concatenate(
+                    topologies, tets, len(nodes),
+                    chunk_size=self.chunk_size, directory=self.storage_dir)
         
         if autogen:
             self.gen_elements()
@@ -311,9 +841,19 @@ class EntityMesh:
                            surface_mesh=None,
                            autogen=True,
                            meshing='auto',
-                           element_size = (0.0,10.0**22)):
+                           element_size = (0.0,10.0**22),
+                           cache=None,
+                           **options):
         """
         Creates an 3d mesh from a surface mesh or stl file.
+        
+        options are passed to the gen_mesh_from_surf of the meshing engine
+        (e.g. algorithm for gmsh, tetrahedralize switches for tetgen).
+        
+        With cache=True (or a MeshCache instance to use another directory)
+        results are stored in a MeshCache and reused when the surface,
+        engine, element size and options are unchanged. By default the cache
+        is only used when the PYFEA_MESH_CACHE environment variable is on.
         """
         
         if surface_mesh: 
@@ -323,6 +863,28 @@ class EntityMesh:
             
         assert self.surface_mesh, 'Please define a surface_mesh first'
         
+        if cache is None:
+            from pyfea.tools.mesh_cache import cache_enabled
+            cache = cache_enabled()
+            
+        if cache is True:
+            from pyfea.tools.mesh_cache import MeshCache
+            cache = MeshCache()
+            
+        if cache:
+            key = cache.key(surface_mesh, meshing, element_size, **options)
+            arrays = cache.load(key)
+            
+            #cache hit, skip meshing entirely
+            if arrays is not None:
+                self.add_geometry(arrays['nodes'], arrays['tets'], autogen=autogen)
+                self._topology = MeshTopology.from_arrays(
+                        self.tets, len(self.nodes),
+                        {name[len('topology_'):]: value for name, value 
+                         in arrays.items() if name.startswith('topology_')},
+                        chunk_size=self.chunk_size, directory=self.storage_dir)
+                return
+        
         #tri = self.surface_mesh.tri
         #points = self.surface_mesh.points
         
@@ -330,7 +892,7 @@ class EntityMesh:
         #TODO: use special tempfile tool
         if not tempfile: 
             import tempfile
-            tempfile = tempfile.TemporaryFile(suffix='.stl').name
+            tempfile = tempfile.NamedTemporaryFile(suffix='.stl', delete=False).name
         surface_mesh.gen_stl(tempfile)
         
         #automatically find new interfaces for meshing
@@ -356,7 +918,7 @@ class EntityMesh:
         elif type(meshing)==str:
             engines = [ engine_dict[meshing] ]
             
-        elif type(engines) == list:
+        elif type(meshing) == list:
             engines = []
             for string in meshing:
                 engines.append(engine_dict[string])
@@ -372,7 +934,7 @@ class EntityMesh:
                 
                     #read temp file
                     try:
-                        geo.gen_mesh_from_surf(tempfile)
+                        geo.gen_mesh_from_surf(tempfile, **options)
                     except ValueError:
                         raise ValueError('Merge failed, is the geometry defined? Please check input file.')
                     
@@ -381,6 +943,11 @@ class EntityMesh:
                     if autogen == True:
                         self.gen_elements()
                         
+                    if cache:
+                        topology = self.topology
+                        topology.tet_to_tet
+                        cache.store(key, self.nodes, self.tets, topology)
+                        
                     break
             except Exception as e:
                 print(e)
@@ -429,7 +996,7 @@ class SurfaceMesh:
     tri=None
 #    normals = None
     
-    def __init__(self, points=None, tri=None, filename=None):
+    def __init__(self, points=None, tri=None, filename=None, tolerance=None):
         if ((type(points) == np.ndarray or
              type(points) == list) and
             (type(tri) == np.ndarray or
@@ -442,7 +1009,7 @@ class SurfaceMesh:
             self.tri = np.array(tri)
 #            self.gen_normals()
         elif filename:
-            self.read_stl(filename)
+            self.read_stl(filename, tolerance=tolerance)
             
 #    def gen_normals(self):
 #        print('WIP: janky solution for normals here')
@@ -475,43 +1042,28 @@ class SurfaceMesh:
         
     def gen_stl(self, filename=None):
         """
-        Generates an stl file from instance data.
+        Generates a binary stl file from instance data.
         """
         
-        from stl import mesh #numpy-stl
+        from pyfea.tools.stl_io import write_stl
         
         if filename == None:
-            filename = tempfile.TemporaryFile(suffix='.vtk').name
-        
-        my_mesh = mesh.Mesh(np.zeros(self.tri.shape[0], dtype=mesh.Mesh.dtype))
-        for i, f in enumerate(self.tri):
-            for j in range(3):
-                my_mesh.vectors[i][j] = self.points[f[j],:]
+            filename = tempfile.NamedTemporaryFile(suffix='.stl', delete=False).name
         
-        my_mesh.save(filename)
+        return write_stl(filename, self.points, self.tri)
         
-        return filename
-        
-    def read_stl(self, filename):
+    def read_stl(self, filename, tolerance=None):
         """
-        Reads an stl to import into instance data.
+        Reads an stl (binary or ASCII) to import into instance data,
+        vertices closer than tolerance are welded if specified.
         """
         
-        from stl import mesh
-        
-        mesh = mesh.Mesh.from_file(filename)
-        mpoints = mesh.points.reshape(mesh.points.shape[0]*3, 3)
-        points = np.unique(mpoints, axis=0)
-        tri = [[points.tolist().index(x[0:3].tolist()),
-                points.tolist().index(x[3:6].tolist()),
-                points.tolist().index(x[6:9].tolist())]
-               for x in mesh.points]  
+        from pyfea.tools.stl_io import read_stl
         
-        self.points = np.array(points)
-        self.tri = np.array(tri)
+        points, tri = read_stl(filename, tolerance=tolerance)
         
-#        mpoints_o = mesh.points
-#        self.normals = np.array(np.c_[mpoints_o, mpoints_o+mesh.normals])
+        self.points = points
+        self.tri = tri
         
 class Part(EntityMesh):
     """
@@ -530,6 +1082,33 @@ class Part(EntityMesh):
         
         self.material = material
         
+def _mesh_part(index, surface_mesh, directory, **kwargs):
+    """
+    Meshes one surface in a worker process (see Assembly.mesh_parts), the
+    result is written to .npy files in directory to be memory-mapped by the
+    parent instead of pickled back.
+    """
+    
+    import time
+    
+    start = time.perf_counter()
+    
+    entity = EntityMesh(surface_mesh=surface_mesh)
+    entity.gen_mesh_from_surf(autogen=False, **kwargs)
+    
+    assert entity.tets is not None, 'Meshing failed for part ' + str(index)
+    
+    files = {}
+    for name in ['nodes', 'tets']:
+        files[name] = os.path.join(directory, 'part_' + str(index) + '_' + name + '.npy')
+        np.save(files[name], getattr(entity, name))
+        
+    return {'index': index,
+            'files': files,
+            'pid': os.getpid(),
+            'n_tets': len(entity.tets),
+            'time': time.perf_counter() - start}
+    
 class Assembly(EntityMesh):
     """
     Is used to compile multiple Part instances to calculate interactions
@@ -537,11 +1116,22 @@ class Assembly(EntityMesh):
     
     parts = []
     tetpart = None
+    node_map = None
+    interfaces = None
+    
+    #per-part results of the last mesh_parts call
+    mesh_timings = None
+    mesh_time = None
+    
+    _tet_attributes = EntityMesh._tet_attributes + ['tetpart']
     
     #sourcefile for existing assembly
     source_file = None
     
-    def __init__(self, parts, auto_unify_mesh = True, **kwargs):
+    _materials = None
+    
+    def __init__(self, parts, auto_unify_mesh = True,
+                 weld = True, tolerance = None, **kwargs):
         """
         Initializes Assembly properties.
         """
@@ -555,7 +1145,7 @@ class Assembly(EntityMesh):
         self.parts = parts
         
         if auto_unify_mesh:
-            self.generate_mesh()
+            self.generate_mesh(weld=weld, tolerance=tolerance)
         
 #    def gen_elements(self):
 #        for part in parts:
@@ -573,44 +1163,202 @@ class Assembly(EntityMesh):
                                  '" is disabled for Assembly instances.')
         ret = super(Assembly, self).__getattribute__(name)
         return ret 
+    
+    @property
+    def materials(self):
+        """
+        Material of every tet, expanded from the part materials and tetpart
+        on first access (None means expand again).
+        """
+        
+        if self._materials is None and self.tetpart is not None:
+            part_materials = np.empty(len(self.parts), dtype=object)
+            part_materials[:] = [part.material for part in self.parts]
+            self._materials = part_materials[np.asarray(self.tetpart)]
+            
+        return self._materials
+    
+    @materials.setter
+    def materials(self, value):
+        self._materials = value
+        
+    def merge_faces(self, tolerance=None):
+        """
+        Welds coincident nodes of adjacent parts so their faces are shared,
+        then finds the interface faces between parts.
+        
+        Sets node_map (concatenated part nodes -> assembly nodes) and
+        interfaces (face nodes and the tets on either side).
+        """
+        
+        self.node_map = self.weld_nodes(tolerance)
+        
+        faces, tet_a, tet_b = shared_faces(self.tets, self.tetpart)
+        self.interfaces = {'faces': faces, 'tets': np.c_[tet_a, tet_b]}
+    
+    def _tet_order(self, method):
+        """
+        Keeps the tets of each part contiguous (and in part order) when
+        renumbering.
+        """
+        
+        order = super(Assembly, self)._tet_order(method)
         
-    #TODO: find a way to merge faces between objects?
-    def merge_faces(self):
+        if self.tetpart is not None:
+            order = order[np.argsort(self.tetpart[order], kind='stable')]
+            
+        return order
+    
+    def _fixed_nodes(self):
         """
-        TODO: merge faces of adjacent parts (HARD)
+        Keeps interfaces between parts in place when smoothing too.
         """
-        pass
+        
+        fixed = super(Assembly, self)._fixed_nodes()
+        
+        if self.interfaces is not None:
+            fixed = np.union1d(fixed, self.interfaces['faces'])
+            
+        return fixed
     
-    def generate_mesh(self):
+    def permute(self, node_order=None, tet_order=None):
         """
-        Naively merges meshes of parts.
+        Permutes the mesh (see EntityMesh.permute) and remaps node_map and
+        interfaces.
+        """
+        
+        n_tets = len(self.tets)
+        node_inverse = super(Assembly, self).permute(node_order, tet_order)
+        
+        if tet_order is None: tet_order = np.arange(n_tets)
+        tet_inverse = np.empty(n_tets, dtype=np.int64)
+        tet_inverse[tet_order] = np.arange(n_tets)
+        
+        if self.node_map is not None:
+            self.node_map = node_inverse[self.node_map]
+        if self.interfaces is not None:
+            self.interfaces = {'faces': node_inverse[self.interfaces['faces']],
+                               'tets': tet_inverse[self.interfaces['tets']]}
+            
+        return node_inverse
+    
+    def generate_mesh(self, weld=True, tolerance=None):
+        """
+        Merges meshes of parts, welding coincident nodes (within tolerance
+        if specified) so adjacency crosses part boundaries.
         """
         
         self.nodes = np.array([])
         self.tets = np.array([])
         self.elements = []
-        self.adjacent = []
         
-        self.merge(entities=self.parts)
+        self.merge(entities=self.parts, autogen=False)
         
-        #TODO: remove duplicate points (will speed up neighbor finder)
+        self.tetpart = np.repeat(np.arange(len(self.parts)),
+                                 [len(part.tets) for part in self.parts])
         
-        ##Remove duplicate nodes
-        #nodes = np.unique(self.nodes,  axis=0)
-        ##Reassign tets to new nodes
-        #shape = self.tets.shape
-        #for point in self.tets.flatten()
+        #expanded from tetpart on access
+        self.materials = None
         
-        self.materials = np.hstack([[part.material]*len(part.tets) 
-                                    for part in self.parts])
+        if weld:
+            self.merge_faces(tolerance)
         
-    #This needs to be replaced
-    def get_cog(self):
+        self.gen_elements()
+        
+    def mesh_parts(self, meshing='auto', element_size=(0.0,10.0**22),
+                   max_workers=None, cache=None, directory=None,
+                   unify_mesh=True, weld=True, tolerance=None, **options):
         """
-        WIP
+        Meshes the surface_mesh of every part, each in its own worker
+        process (with its own gmsh/tetgen instance, processes are not
+        reused between parts). Results come back as .npy files in
+        directory: parts keep memory-mapped views of them and the files are
+        kept. Without a directory they go to a temp directory which is
+        removed once the arrays are loaded in memory.
+        
+        max_workers defaults to the number of cores, max_workers=1 meshes
+        in this process. Workers are spawned and import the main script
+        again, so scripts need an if __name__ == '__main__': guard. cache
+        and the engine options are passed to gen_mesh_from_surf (the cache
+        is off unless PYFEA_MESH_CACHE is on). Returns (and keeps as
+        mesh_timings) one dict per part with the meshing time, number of
+        tets and worker pid.
         """
-        print('WIP')
         
+        import shutil
+        
+        for part in self.parts:
+            assert part.surface_mesh, 'Please define a surface_mesh for every part first'
+            
+        temporary = directory is None
+        if temporary:
+            directory = tempfile.mkdtemp(prefix='pyfea_mesh_')
+        os.makedirs(directory, exist_ok=True)
+        
+        try:
+            results = self._mesh_parts(directory, meshing, element_size,
+                                       max_workers, cache, temporary, options)
+        finally:
+            if temporary:
+                shutil.rmtree(directory, ignore_errors=True)
+                
+        if unify_mesh:
+            self.generate_mesh(weld=weld, tolerance=tolerance)
+            
+        return results
+    
+    def _mesh_parts(self, directory, meshing, element_size, max_workers,
+                    cache, in_memory, options):
+        """
+        Meshes the parts into directory and adds the results to them (see
+        mesh_parts), loaded in memory or as copy-on-write memmaps.
+        """
+        
+        import time
+        
+        kwargs = dict(options, meshing=meshing, element_size=element_size,
+                      cache=cache)
+        
+        start = time.perf_counter()
+        
+        if max_workers == 1 or len(self.parts) == 1:
+            results = [_mesh_part(i, part.surface_mesh, directory, **kwargs)
+                       for i, part in enumerate(self.parts)]
+        else:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            
+            #gmsh keeps global state, use fresh processes for every part
+            context = multiprocessing.get_context('spawn')
+            try:
+                pool = ProcessPoolExecutor(max_workers=max_workers,
+                                           mp_context=context,
+                                           max_tasks_per_child=1)
+            except TypeError:
+                #python < 3.11
+                pool = ProcessPoolExecutor(max_workers=max_workers,
+                                           mp_context=context)
+                
+            with pool:
+                futures = [pool.submit(_mesh_part, i, part.surface_mesh,
+                                       directory, **kwargs)
+                           for i, part in enumerate(self.parts)]
+                results = [future.result() for future in futures]
+                
+        mmap_mode = None if in_memory else 'c'
+        
+        for result in results:
+            part = self.parts[result['index']]
+            part.add_geometry(np.load(result['files']['nodes'], mmap_mode=mmap_mode),
+                              np.load(result['files']['tets'], mmap_mode=mmap_mode))
+            
+            result['part'] = part.name
+            
+        self.mesh_timings = results
+        self.mesh_time = time.perf_counter() - start
+        
+        return results
+    
     #this will need updating
     def plot(self, **kwargs):
         """
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Per-element geometric quantities of tet meshes, computed in batches (all
+tets at once, or in chunks for out-of-core meshes) and cached.
+"""
+
+import numpy as np
+
+from pyfea.fea.topology import TET_FACES
+
+class TetGeometry:
+    """
+    Geometry table of a tet mesh. Each field is computed on first access
+    (fields computed in the same pass are built together) and kept:
+
+    - volumes: (n,) signed volumes (positive when TET_FACES point outwards)
+    - centroids: (n, 3)
+    - face_areas: (n, 4), face j is opposite vertex j
+    - face_normals: (n, 4, 3) outward unit normals, whatever the orientation
+    - inradius: (n,) radius of the inscribed sphere, 3|V| / sum of areas
+    - gradients: (n, 4, 3) gradients of the linear shape functions,
+      grad N_j = -area_j * normal_j / (3|V|)
+    """
+
+    nodes = None
+    tets = None
+    n_tets = 0
+    chunk_size = None
+
+    def __init__(self, nodes, tets, chunk_size=None, allocate=None):
+        """
+        Wraps the (n_nodes, 3) nodes and (n, 4) tets arrays, memory-mapped
+        arrays are kept as they are.
+
+        Fields are computed in blocks of chunk_size tets (all at once by
+        default) into arrays from allocate(name, shape, dtype), eg. memmaps
+        for out-of-core meshes (in memory by default).
+        """
+
+        self.nodes = np.asanyarray(nodes)
+        self.tets = np.asanyarray(tets)
+        self.n_tets = len(self.tets)
+        self.chunk_size = chunk_size
+
+        self._allocate = allocate
+        self._cache = {}
+
+    def _get(self, name, builder):
+        """
+        Returns a cached field, building it on first access.
+        """
+
+        if name not in self._cache:
+            self._cache.update(builder())
+        return self._cache[name]
+
+    def chunks(self):
+        """
+        Yields slices over the tets of at most chunk_size.
+        """
+
+        chunk_size = self.chunk_size or max(self.n_tets, 1)
+        for start in range(0, self.n_tets, chunk_size):
+            yield slice(start, min(start + chunk_size, self.n_tets))
+
+    def coords(self, index=slice(None)):
+        """
+        Returns the (n, 4, 3) vertex coordinates of the selected tets (not
+        cached).
+        """
+
+        return np.asarray(self.nodes[np.asarray(self.tets[index])], dtype=np.float64)
+
+    def _build(self, fields, compute):
+        """
+        Allocates the (name, trailing shape) fields and fills them chunk by
+        chunk with compute(chunk), which returns a dict of chunk values.
+        """
+
+        out = {}
+        for name, shape in fields:
+            shape = (self.n_tets,) + shape
+            if self._allocate is None:
+                out[name] = np.empty(shape)
+            else:
+                out[name] = self._allocate(name, shape, np.float64)
+
+        for chunk in self.chunks():
+            for name, values in compute(chunk).items():
+                out[name][chunk] = values
+
+        return out
+
+    def _build_volumes(self):
+        """
+        Signed volumes.
+        """
+
+        def compute(chunk):
+            c = self.coords(chunk)
+            d = c[:, 1:] - c[:, :1]
+
+            volumes = np.einsum('ij,ij->i', np.cross(d[:, 0], d[:, 1]), d[:, 2])/6.
+
+            return {'volumes': volumes}
+
+        return self._build([('volumes', ())], compute)
+
+    def _build_centroids(self):
+        """
+        Centroids.
+        """
+
+        def compute(chunk):
+            return {'centroids': self.coords(chunk).mean(axis=1)}
+
+        return self._build([('centroids', (3,))], compute)
+
+    def _build_faces(self):
+        """
+        Face areas and outward unit normals.
+        """
+
+        volumes = self.volumes
+
+        def compute(chunk):
+            f = self.coords(chunk)[:, TET_FACES]
+
+            #area-weighted normals, outward for positively oriented tets
+            normals = np.cross(f[:, :, 1] - f[:, :, 0], f[:, :, 2] - f[:, :, 0])/2.
+            areas = np.linalg.norm(normals, axis=2)
+
+            sign = np.where(volumes[chunk] < 0, -1., 1.)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                normals *= (sign[:, None] / areas)[:, :, None]
+
+            return {'face_areas': areas, 'face_normals': normals}
+
+        return self._build([('face_areas', (4,)), ('face_normals', (4, 3))], compute)
+
+    def _build_derived(self):
+        """
+        Inscribed radii and shape function gradients.
+        """
+
+        volumes, face_areas, face_normals = self.volumes, self.face_areas, self.face_normals
+
+        def compute(chunk):
+            volume = np.abs(volumes[chunk])
+            areas = np.asarray(face_areas[chunk])
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                inradius = 3*volume/areas.sum(axis=1)
+                gradients = -(areas/(3*volume[:, None]))[:, :, None]*face_normals[chunk]
+
+            return {'inradius': inradius, 'gradients': gradients}
+
+        return self._build([('inradius', ()), ('gradients', (4, 3))], compute)
+
+    @property
+    def volumes(self):
+        return self._get('volumes', self._build_volumes)
+
+    @property
+    def centroids(self):
+        return self._get('centroids', self._build_centroids)
+
+    @property
+    def face_areas(self):
+        return self._get('face_areas', self._build_faces)
+
+    @property
+    def face_normals(self):
+        return self._get('face_normals', self._build_faces)
+
+    @property
+    def inradius(self):
+        return self._get('inradius', self._build_derived)
+
+    @property
+    def gradients(self):
+        return self._get('gradients', self._build_derived)
+
+    def element_gradients(self, index=slice(None)):
+        """
+        Returns the absolute volumes and shape function gradients of the
+        selected tets, from the tables if already built, otherwise computed
+        from the vertex coordinates without building (or caching) any table
+        (see shape_gradients).
+        """
+
+        if 'gradients' in self._cache:
+            return np.abs(self.volumes[index]), np.asarray(self.gradients[index])
+
+        volumes, gradients = shape_gradients(self.coords(index))
+        return np.abs(volumes), gradients
+
+    @property
+    def total_volume(self):
+        """
+        Sum of the (absolute) tet volumes.
+        """
+        return sum(np.abs(self.volumes[chunk]).sum() for chunk in self.chunks())
+
+def shape_gradients(coords):
+    """
+    Returns the signed volumes and (n, 4, 3) linear shape function
+    gradients of tets with (n, 4, 3) vertex coordinates, from the edges
+    e_i = x_i - x_0: grad N_1 = e_2 x e_3 / (6V) (and cyclic), grad N_0 =
+    -(grad N_1 + grad N_2 + grad N_3).
+    """
+
+    d = coords[:, 1:] - coords[:, :1]
+
+    scaled = np.stack([np.cross(d[:, 1], d[:, 2]),
+                       np.cross(d[:, 2], d[:, 0]),
+                       np.cross(d[:, 0], d[:, 1])], axis=1)
+    det = np.einsum('ij,ij->i', d[:, 0], scaled[:, 0])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gradients = scaled/det[:, None, None]
+
+    return det/6., np.concatenate([-gradients.sum(axis=1, keepdims=True),
+                                   gradients], axis=1)
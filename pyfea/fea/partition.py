@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Mesh partitioning for domain decomposition. Tets are split by recursive
+coordinate or inertial bisection of their centroids, then optionally
+refined on the tet dual graph (face adjacency) to reduce the edge cut.
+"""
+
+import numpy as np
+
+def _split_axis(points, weights, method):
+    """
+    Returns the direction a set of points is bisected along.
+    """
+
+    if method == 'coordinate':
+        axis = np.zeros(points.shape[1])
+        axis[np.argmax(np.ptp(points, axis=0))] = 1
+        return axis
+
+    elif method == 'inertial':
+        center = np.average(points, axis=0, weights=weights)
+        d = points - center
+        inertia = np.einsum('ij,ik->jk', d*weights[:, None], d)
+        return np.linalg.eigh(inertia)[1][:, -1]
+
+    raise ValueError('Unknown bisection method: ' + str(method))
+
+def recursive_bisection(points, n_parts, method='inertial', weights=None):
+    """
+    Partitions (n, 3) points into n_parts sets of balanced total weight.
+    Each set is cut at the weighted median along its longest axis
+    ('coordinate') or principal axis of inertia ('inertial'), any n_parts
+    is supported (sets are cut in proportion to their number of parts).
+
+    Returns the part label of each point.
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    weights = np.ones(len(points)) if weights is None \
+              else np.asarray(weights, dtype=np.float64)
+
+    labels = np.zeros(len(points), dtype=np.int32)
+
+    #(indices, number of parts, first label)
+    stack = [(np.arange(len(points)), n_parts, 0)]
+    while stack:
+        index, k, label = stack.pop()
+
+        if k == 1 or len(index) == 0:
+            labels[index] = label
+            continue
+
+        k_left = k // 2
+
+        axis = _split_axis(points[index], weights[index], method)
+        order = np.argsort(points[index] @ axis, kind='stable')
+
+        cumulative = np.cumsum(weights[index][order])
+        split = np.searchsorted(cumulative, cumulative[-1]*k_left/k)
+        split = min(max(split, 1), len(index) - 1) if len(index) > 1 else split
+
+        stack.append((index[order[:split]], k_left, label))
+        stack.append((index[order[split:]], k - k_left, label + k_left))
+
+    return labels
+
+def _connections(csr, labels, n_parts):
+    """
+    Returns the (tet, part, count) triplets of face connections from each
+    tet to each part, for tets on partition boundaries.
+    """
+
+    flat, row_splits = csr
+    rows = np.repeat(np.arange(len(row_splits) - 1), np.diff(row_splits))
+    cut = labels[rows] != labels[flat]
+
+    boundary = np.unique(rows[cut])
+    mask = np.isin(rows, boundary)
+
+    keys = rows[mask].astype(np.int64)*n_parts + labels[flat[mask]]
+    keys, counts = np.unique(keys, return_counts=True)
+
+    return keys // n_parts, keys % n_parts, counts
+
+def refine_partition(csr, labels, n_parts, weights=None,
+                     max_imbalance=1.05, iterations=10):
+    """
+    Greedy boundary refinement on a graph given as CSR arrays: tets on
+    partition boundaries move to the neighboring part they share the most
+    faces with if this lowers the edge cut and keeps every part below
+    max_imbalance times the average weight.
+
+    Moves are applied in batches (all tets at once), alternating the
+    direction of moves between parts each iteration to avoid swapping
+    neighbors back and forth.
+    """
+
+    labels = np.array(labels, dtype=np.int32)
+    weights = np.ones(len(labels)) if weights is None \
+              else np.asarray(weights, dtype=np.float64)
+
+    capacity = max_imbalance*weights.sum()/n_parts
+
+    idle = 0
+    for iteration in range(iterations):
+        tet, part, count = _connections(csr, labels, n_parts)
+        if len(tet) == 0:
+            break
+
+        own = part == labels[tet]
+        internal = np.zeros(len(labels), dtype=np.int64)
+        internal[tet[own]] = count[own]
+
+        #best other part per tet
+        tet, part, count = tet[~own], part[~own], count[~own]
+        order = np.lexsort((-count, tet))
+        tet, part, count = tet[order], part[order], count[order]
+        first = np.r_[True, tet[1:] != tet[:-1]]
+        tet, part, count = tet[first], part[first], count[first]
+
+        gain = count - internal[tet]
+
+        direction = (part > labels[tet]) if iteration % 2 == 0 \
+                    else (part < labels[tet])
+        move = (gain > 0) & direction
+        tet, part, gain = tet[move], part[move], gain[move]
+
+        #fill each target part up to capacity, best gains first
+        load = np.bincount(labels, weights=weights, minlength=n_parts)
+        order = np.lexsort((-gain, part))
+        tet, part = tet[order], part[order]
+
+        added = np.cumsum(weights[tet])
+        starts = np.searchsorted(part, part)
+        added -= np.r_[0, added][starts]
+        accept = load[part] + added <= capacity
+        labels[tet[accept]] = part[accept]
+
+        #stop once neither direction improves anything
+        idle = 0 if accept.any() else idle + 1
+        if idle == 2:
+            break
+
+    return labels
+
+class Partitioning:
+    """
+    Decomposition of a mesh into n_parts subdomains.
+
+    Index lists are CSR arrays (flat, row_splits) over partitions, the
+    entries of partition p being flat[row_splits[p]:row_splits[p+1]]:
+
+    - owned: tets of each partition (sorted)
+    - interface: owned tets with a face neighbor in another partition
+    - halo: tets of other partitions sharing a face with the partition
+    - shared_nodes: nodes of the partition also used by other partitions
+
+    local_index maps each tet to its index within its partition, submesh
+    gives a partition with local node and tet numbering.
+    """
+
+    labels = None
+    n_parts = 0
+    tets = None
+    csr = None
+
+    def __init__(self, labels, n_parts, tets, csr):
+        """
+        Wraps part labels of the (n, 4) tets with their face adjacency
+        (CSR arrays).
+        """
+
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.n_parts = n_parts
+        self.tets = tets
+        self.csr = csr
+
+        self._cache = {}
+
+    def _group(self, part, values):
+        """
+        Groups values by partition into CSR arrays (values sorted, unique).
+        """
+
+        base = int(values.max()) + 1 if len(values) else 1
+        keys = np.unique(part.astype(np.int64)*base + values)
+        part, values = np.divmod(keys, base)
+
+        row_splits = np.zeros(self.n_parts + 1, dtype=np.int64)
+        np.cumsum(np.bincount(part, minlength=self.n_parts), out=row_splits[1:])
+
+        return values, row_splits
+
+    def _cut_edges(self):
+        if 'cut' not in self._cache:
+            flat, row_splits = self.csr
+            rows = np.repeat(np.arange(len(row_splits) - 1), np.diff(row_splits))
+            cut = self.labels[rows] != self.labels[flat]
+            self._cache['cut'] = (rows[cut], np.asarray(flat)[cut])
+        return self._cache['cut']
+
+    @property
+    def sizes(self):
+        """
+        Number of tets in each partition.
+        """
+        return np.bincount(self.labels, minlength=self.n_parts)
+
+    @property
+    def imbalance(self):
+        """
+        Largest partition size over the average size.
+        """
+        return self.sizes.max()*self.n_parts/len(self.labels)
+
+    @property
+    def edge_cut(self):
+        """
+        Number of faces between partitions.
+        """
+        return len(self._cut_edges()[0]) // 2
+
+    @property
+    def owned(self):
+        if 'owned' not in self._cache:
+            flat = np.argsort(self.labels, kind='stable')
+            row_splits = np.zeros(self.n_parts + 1, dtype=np.int64)
+            np.cumsum(self.sizes, out=row_splits[1:])
+            self._cache['owned'] = (flat, row_splits)
+        return self._cache['owned']
+
+    @property
+    def local_index(self):
+        if 'local_index' not in self._cache:
+            flat, row_splits = self.owned
+            local = np.empty(len(self.labels), dtype=np.int64)
+            local[flat] = np.arange(len(flat)) - np.repeat(row_splits[:-1],
+                                                           np.diff(row_splits))
+            self._cache['local_index'] = local
+        return self._cache['local_index']
+
+    @property
+    def interface(self):
+        if 'interface' not in self._cache:
+            rows, _ = self._cut_edges()
+            self._cache['interface'] = self._group(self.labels[rows], rows)
+        return self._cache['interface']
+
+    @property
+    def halo(self):
+        if 'halo' not in self._cache:
+            rows, cols = self._cut_edges()
+            self._cache['halo'] = self._group(self.labels[rows], cols)
+        return self._cache['halo']
+
+    @property
+    def shared_nodes(self):
+        if 'shared_nodes' not in self._cache:
+            tets = np.asarray(self.tets)
+            node = tets.ravel().astype(np.int64)
+            part = np.repeat(self.labels, tets.shape[1]).astype(np.int64)
+
+            keys = np.unique(node*self.n_parts + part)
+            node, part = np.divmod(keys, self.n_parts)
+
+            #nodes appearing in more than one partition
+            counts = np.bincount(node)
+            shared = counts[node] > 1
+            self._cache['shared_nodes'] = self._group(part[shared], node[shared])
+        return self._cache['shared_nodes']
+
+    def submesh(self, index, nodes=None, halo=True):
+        """
+        Returns partition index with local numbering as a dict:
+
+        - tets: (m, 4) local tets, owned tets first then halo tets
+        - n_owned: number of owned tets
+        - tet_ids / node_ids: global indices of the local tets / nodes
+        - nodes: local node coordinates (if the mesh nodes are given)
+        """
+
+        flat, row_splits = self.owned
+        tet_ids = flat[row_splits[index]:row_splits[index+1]]
+        n_owned = len(tet_ids)
+
+        if halo:
+            flat, row_splits = self.halo
+            tet_ids = np.concatenate([tet_ids, flat[row_splits[index]:row_splits[index+1]]])
+
+        node_ids, local_tets = np.unique(np.asarray(self.tets)[tet_ids],
+                                         return_inverse=True)
+
+        submesh = {'tets': local_tets.reshape(-1, 4),
+                   'n_owned': n_owned,
+                   'tet_ids': tet_ids,
+                   'node_ids': node_ids}
+        if nodes is not None:
+            submesh['nodes'] = np.asarray(nodes)[node_ids]
+
+        return submesh
+
+def partition(tets, points, csr, n_parts, method='inertial',
+              refine=True, weights=None, max_imbalance=1.05):
+    """
+    Partitions tets (with centroids points and face adjacency csr) into
+    n_parts, returns a Partitioning.
+    """
+
+    labels = recursive_bisection(points, n_parts, method=method, weights=weights)
+
+    if refine:
+        labels = refine_partition(csr, labels, n_parts, weights=weights,
+                                  max_imbalance=max_imbalance)
+
+    return Partitioning(labels, n_parts, tets, csr)
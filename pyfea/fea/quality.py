@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Element quality metrics of tet meshes, computed for all elements at once
+from a TetGeometry table.
+"""
+
+import numpy as np
+
+from pyfea.fea.metrics import TetGeometry
+
+#vertex pairs of the 6 edges and the 2 vertices not on each edge (the
+#faces opposite those vertices are the faces sharing the edge)
+TET_EDGES = np.array([[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]])
+TET_EDGE_FACES = np.array([[2, 3], [1, 3], [1, 2], [0, 3], [0, 2], [0, 1]])
+
+#whether a larger value is worse, for sorting
+WORSE_IF_LARGER = {'mean_ratio': False,
+                   'aspect_ratio': True,
+                   'radius_ratio': False,
+                   'min_dihedral': False,
+                   'max_dihedral': True,
+                   'volume': False}
+
+def edge_lengths(geometry):
+    """
+    Returns the (n, 6) edge lengths, ordered as TET_EDGES.
+    """
+
+    def lengths(c):
+        return np.linalg.norm(c[:, TET_EDGES[:, 1]] - c[:, TET_EDGES[:, 0]], axis=2)
+
+    return np.concatenate([lengths(geometry.coords(chunk))
+                           for chunk in geometry.chunks()] or [np.empty((0, 6))])
+
+def circumradius(geometry, edges=None):
+    """
+    Returns the circumscribed sphere radii from the products of opposite
+    edge lengths.
+    """
+
+    if edges is None: edges = edge_lengths(geometry)
+
+    #opposite edges: 01-23, 02-13, 03-12
+    a = edges[:, 0]*edges[:, 5]
+    b = edges[:, 1]*edges[:, 4]
+    c = edges[:, 2]*edges[:, 3]
+
+    product = (a + b + c)*(a + b - c)*(a - b + c)*(-a + b + c)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(np.maximum(product, 0))/(24*np.abs(geometry.volumes))
+
+def mean_ratio_coords(coords):
+    """
+    Returns the mean ratio 12 (3V)^(2/3) / sum(edge lengths^2) of tets with
+    (n, 4, 3) vertex coordinates, 1 for a regular tet, 0 for flat tets and
+    negative for inverted ones.
+    """
+
+    d = coords[:, 1:] - coords[:, :1]
+    volume = np.einsum('ij,ij->i', np.cross(d[:, 0], d[:, 1]), d[:, 2])/6.
+
+    edges = coords[:, TET_EDGES[:, 1]] - coords[:, TET_EDGES[:, 0]]
+    squares = np.einsum('ijk,ijk->i', edges, edges)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = 12*np.sign(volume)*np.cbrt(3*np.abs(volume))**2/squares
+
+    return np.nan_to_num(ratio)
+
+def mean_ratio(geometry):
+    """
+    Returns the mean ratio quality of every tet (see mean_ratio_coords).
+    """
+
+    return np.concatenate([mean_ratio_coords(geometry.coords(chunk))
+                           for chunk in geometry.chunks()] or [np.empty(0)])
+
+def dihedral_angles(geometry):
+    """
+    Returns the (n, 6) interior dihedral angles (radians) at the edges,
+    ordered as TET_EDGES.
+    """
+
+    normals = geometry.face_normals
+    cos = np.einsum('nij,nij->ni', normals[:, TET_EDGE_FACES[:, 0]],
+                    normals[:, TET_EDGE_FACES[:, 1]])
+
+    return np.pi - np.arccos(np.clip(cos, -1, 1))
+
+class QualityReport:
+    """
+    Quality metrics of every element:
+
+    - mean_ratio: 12 (3V)^(2/3) / sum of squared edge lengths, 1 for a
+      regular tet, negative for inverted tets
+    - aspect_ratio: longest edge / (2 sqrt(6) inradius), 1 for a regular tet
+    - radius_ratio: 3 inradius / circumradius, 1 for a regular tet and 0 for
+      flat (sliver) tets
+    - min_dihedral, max_dihedral: in degrees
+    - volume: signed volume, negative for inverted tets
+    """
+
+    metrics = ['mean_ratio', 'aspect_ratio', 'radius_ratio', 'min_dihedral',
+               'max_dihedral', 'volume']
+
+    def __init__(self, geometry):
+        """
+        Computes every metric from a TetGeometry.
+        """
+
+        self.mean_ratio = mean_ratio(geometry)
+
+        edges = edge_lengths(geometry)
+        inradius = geometry.inradius
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.aspect_ratio = edges.max(axis=1)/(2*np.sqrt(6)*inradius)
+            self.radius_ratio = 3*inradius/circumradius(geometry, edges)
+
+        #degenerate tets
+        self.aspect_ratio[~np.isfinite(self.aspect_ratio)] = np.inf
+        self.radius_ratio[~np.isfinite(self.radius_ratio)] = 0
+
+        angles = np.degrees(dihedral_angles(geometry))
+        self.min_dihedral = np.nan_to_num(angles.min(axis=1), nan=0.)
+        self.max_dihedral = np.nan_to_num(angles.max(axis=1), nan=180.)
+
+        self.volume = geometry.volumes
+
+    def __len__(self):
+        return len(self.volume)
+
+    @property
+    def inverted(self):
+        """
+        Indices of the tets with negative volume.
+        """
+        return np.nonzero(self.volume < 0)[0]
+
+    def histogram(self, metric='radius_ratio', bins=10, range=None):
+        """
+        Returns (counts, bin_edges) of a metric (radius and mean ratios
+        default to the [0, 1] range).
+        """
+
+        values = getattr(self, metric)
+        if range is None and metric in ['radius_ratio', 'mean_ratio']:
+            range = (0, 1)
+
+        return np.histogram(values[np.isfinite(values)], bins=bins, range=range)
+
+    def worst(self, metric='radius_ratio', n=10):
+        """
+        Returns the indices of the n worst elements for a metric, worst
+        first.
+        """
+
+        values = getattr(self, metric)
+        if WORSE_IF_LARGER[metric]:
+            values = -values
+
+        n = min(n, len(values))
+        index = np.argpartition(values, n - 1)[:n] if n else np.zeros(0, dtype=np.int64)
+
+        return index[np.argsort(values[index], kind='stable')]
+
+    def summary(self):
+        """
+        Returns a printable table of min/mean/max of every metric.
+        """
+
+        lines = ['{:<14}{:>12}{:>12}{:>12}'.format('metric', 'min', 'mean', 'max')]
+        for metric in self.metrics:
+            values = getattr(self, metric)
+            values = values[np.isfinite(values)]
+            if len(values) == 0: continue
+            lines.append('{:<14}{:>12.4g}{:>12.4g}{:>12.4g}'.format(
+                metric, values.min(), values.mean(), values.max()))
+        lines.append(str(len(self.inverted)) + ' inverted of ' + str(len(self)) + ' tets')
+
+        return '\n'.join(lines)
+
+def mesh_quality(nodes, tets):
+    """
+    Returns the QualityReport of a tet mesh.
+    """
+
+    return QualityReport(TetGeometry(nodes, tets))
+
+def fix_orientation(nodes, tets):
+    """
+    Swaps two vertices of every inverted tet in place (tets must be
+    writable), returns the indices of the fixed tets.
+    """
+
+    geometry = TetGeometry(nodes, tets)
+    inverted = np.nonzero(geometry.volumes < 0)[0]
+
+    tets[inverted[:, None], [0, 1]] = tets[inverted[:, None], [1, 0]]
+
+    return inverted
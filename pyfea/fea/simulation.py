@@ -16,10 +16,10 @@ import copy
 import pandas as pd
 import numpy as np
 import pyvista as pv
-        
-import tensorflow as tf
 
 from pyfea.fea.materials import Material
+import pyfea.fea.fem as fem
+import pyfea.fea.solvers as solvers
 
 import time
 
@@ -206,13 +206,13 @@ class Simulation():
                 dt = 0.5, t=None, update_scale=True,
                 **kwargs):
         
-        var = self.getvar(sim_property).to_numpy()
-        
-        pv.UnstructuredGrid(self.assembly.export_vtk())
+        #only the outer surface is drawn, values of the owner tets
+        owners = self.assembly.boundary['tets']
+        var = self.getvar(sim_property).to_numpy()[owners]
         
 #        if not cmap: cmap = plt.cm.get_cmap("viridis", 5)
         
-        grid = pv.UnstructuredGrid(self.assembly.export_vtk())
+        grid = self.assembly.export_surface()
         grid.cell_arrays[sim_property]=var
         grid.set_active_scalar(sim_property)
         
@@ -238,7 +238,7 @@ class Simulation():
             t_c = 0
             
             while not t or t_c < t:
-                var = sim.getvar(sim_property).to_numpy()
+                var = sim.getvar(sim_property).to_numpy()[owners]
                 grid.cell_arrays[sim_property]=var
                 if update_scale:
                     plotter.update_scalar_bar_range([var.min(), var.max()])
@@ -326,12 +326,16 @@ class Simulation():
             self.start_time = time.time()
             self.sim_time = 0
             
+            #the assembly is only read by the effects, it is shared rather
+            #than copied (a deep copy loads out-of-core memmaps in memory)
             for arg in kwargs:
-                setattr(self, arg, copy.deepcopy(kwargs[arg]))
+                value = kwargs[arg] if arg == 'assembly' else copy.deepcopy(kwargs[arg])
+                setattr(self, arg, value)
                 
             for index, effect in enumerate(self.physics_effects):
                 
-                pe = effect(self)
+                options = getattr(self, 'parameters', {}).get(effect.__name__, {})
+                pe = effect(self, **options)
                 
                 self.physics_effects[index] = pe
                 
@@ -465,14 +469,70 @@ class Physics_Effect_Base:
     
     testvar = 'test'
     
+    #linear solver and options, see pyfea.fea.solvers
+    solver = None
+    preconditioner = None
+    solver_options = {}
+    preconditioner_options = {}
+    tolerance = 1e-8
+    max_iterations = None
+    
     def __init__(self, simulation, **kwargs):
         self.simulation = simulation
         
+        #per-simulation options
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+        
     def calculate(self):
         """
         This is where the matrix calculations are done
         """
         
+    def get_solver(self, solver=None, preconditioner=None):
+        """
+        Returns a new instance of the linear solver of the effect (or of the
+        given solver and preconditioner names, with the effect options).
+        """
+        
+        options = {'tolerance': self.tolerance, 
+                   'max_iterations': self.max_iterations,
+                   'preconditioner_options': self.preconditioner_options}
+        options.update(self.solver_options)
+        
+        return solvers.get_solver(solver or self.solver,
+                                  preconditioner or self.preconditioner, **options)
+        
+    def material_state(self, names):
+        """
+        Returns the state matrices of the effect are assembled from: the
+        assembly geometry, the materials array, its material_index and
+        the values of the named properties of each distinct material.
+        """
+        
+        assembly = self.simulation.assembly
+        
+        #distinct materials are only looked up again for a new materials array
+        cached = getattr(self, '_material_index', None)
+        if cached is None or cached[0] is not assembly.materials:
+            cached = (assembly.materials, fem.material_index(assembly.materials))
+            self._material_index = cached
+        
+        props = tuple(tuple(getattr(m, name, None) for name in names) 
+                      for m in cached[1][0])
+        
+        return (assembly.geometry, assembly.materials, cached[1], props)
+    
+    @staticmethod
+    def state_changed(old, new):
+        """
+        Whether the geometry, materials or material properties differ
+        between two material_state results.
+        """
+        
+        return old is None or old[0] is not new[0] or old[1] is not new[1] \
+               or old[3] != new[3]
+        
     @classmethod
     def define_variables(cls, simulation):
         """
@@ -499,76 +559,402 @@ class Physics_Effect_Base:
     
 class Thermal_Conduction(Physics_Effect_Base):
     """
-    A class to define conduction calculations
+    Linear (P1) tetrahedral heat conduction, density*Cp dT/dt = div(k grad T)
+    with insulated boundaries.
+    
+    Temperatures are solved at the nodes with one of the schemes:
+    
+    - 'explicit': forward Euler on the lumped capacity, one sparse mat-vec
+      per step, limited to the stable timestep
+    - 'backward_euler' or 'crank_nicolson': implicit, one linear solve
+      per step (solver option, see pyfea.fea.solvers, sparse LU by
+      default). The factorization is reused until dt, the materials or the
+      mesh geometry change, statistics are in stepper.solver.stats.
+      
+    On out-of-core meshes (see EntityMesh.to_out_of_core) the conductivity
+    is applied matrix-free in chunks of the mesh chunk size unless
+    matrix_free is set, and implicit schemes default to Jacobi
+    preconditioned conjugate gradients (direct solvers need the assembled
+    matrix).
+      
+    The timestep is dt if set, otherwise the stable explicit step (times
+    implicit_multiple for implicit schemes). Options are set as class
+    attributes or per simulation through 
+    Simulation.parameters['Thermal_Conduction'] = {'scheme': ..., 'dt': ...}.
+    
+    The tet column 'T' holds the mean of the nodes of each tet, and is
+    projected back onto the nodes if it was changed outside of the effect
+    (eg. to set initial temperatures).
     """
     
     timestep = None
     variables = ['T']
-    materialprops = ['Cp','k']
+    materialprops = ['Cp','k','density']
+    
+    scheme = 'explicit'
+    dt = None
+    
+    #fraction of the stable explicit timestep
+    safety = 0.9
+    #default implicit timestep in stable explicit timesteps
+    implicit_multiple = 100.
+    #crank_nicolson steps taken as two backward Euler half steps after
+    #(re)starting, damps the oscillations of non-smooth temperatures
+    startup_steps = 4
+    #consistent capacity for implicit schemes if False
+    lumped = True
+    
+    #defaults to 'lu', or 'cg' (jacobi) on out-of-core meshes
+    solver = None
+    
+    #conductivity applied element by element instead of assembled (see
+    #fem.ElementOperator), for explicit or iterative implicit runs,
+    #defaults to True on out-of-core meshes only
+    matrix_free = None
     
     def __init__(self, simulation, **kwargs):
         super(Thermal_Conduction, self).__init__(simulation, **kwargs)
         
-#        self.parts = kwargs['thermal_sim_parts']
-            
-    def get_timestep(self):
-        #TODO: Placeholder function
-        self.timestep = 0.1 #s
+        assert self.scheme in fem.ThetaStepper.schemes, \
+            'scheme must be one of ' + str(list(fem.ThetaStepper.schemes))
         
-        return self.timestep
+        self.conductivity = None
+        self.capacity = None
+        self.stepper = None
         
-    def calculate(self, dt):
+        self.T_nodes = None
+        self._T_tets = None
+        
+        self._state = None
+        self._stable_dt = None
+        
+    def assemble(self):
         """
-        Calculates the conduction (currently dummy formula)
+        Assembles the conductivity matrix and capacity from the element
+        geometry and the materials of the assembly, if they changed.
         """
         
-        sim = self.simulation
+        state = self.material_state(['k', 'Cp', 'density'])
+        if not self.state_changed(self._state, state):
+            return
+        
         assembly = self.simulation.assembly
+        geometry = assembly.geometry
+        n_nodes = len(assembly.nodes)
+        index = state[2]
+        
+        out_of_core = assembly.chunk_size is not None
+        matrix_free = out_of_core if self.matrix_free is None else self.matrix_free
+        
+        k = fem.material_property(assembly.materials, 'k', index=index)
+        c = fem.material_property(assembly.materials, 'Cp', index=index) \
+            * fem.material_property(assembly.materials, 'density', default=1., 
+                                    index=index)
+        
+        if matrix_free:
+            distinct, inverse = index
+            self.conductivity = fem.conductivity_operator(
+                geometry, n_nodes, fem.material_property(distinct, 'k'), inverse,
+                chunk_size=assembly.chunk_size or 2**16)
+        else:
+            self.conductivity = fem.conductivity_matrix(geometry, n_nodes, k)
+        self.capacity = fem.capacity_matrix(geometry, n_nodes, c)
+        
+        explicit = self.scheme == 'explicit'
+        capacity = self.capacity if self.lumped or explicit \
+                   else fem.capacity_matrix(geometry, n_nodes, c, lumped=False)
+        
+        if self.solver is None and out_of_core:
+            solver = self.get_solver('cg', 'jacobi')
+        else:
+            solver = self.get_solver(self.solver or 'lu')
+        
+        #new matrices, factorized again on the next step
+        self.stepper = fem.ThetaStepper(self.conductivity, capacity, self.scheme,
+                                        solver=solver, startup=self.startup_steps)
+        self._state = state
+        self._stable_dt = None
+        
+    def nodal_temperatures(self):
+        """
+        Returns the nodal temperatures, re-projected (volume-weighted) from
+        the tet temperatures if those changed since the last step.
+        """
         
-        # TODO: This is bogus math
+        assembly = self.simulation.assembly
+        T = self.simulation.variables['T'].values
         
-        T = tf.constant(self.simulation.variables['T'].values, dtype=tf.float64)
-#        Cp = tf.constant(self.simulation.variables['Cp'].values, dtype=tf.float64)
-#        k = tf.constant(self.simulation.variables['k'].values, dtype=tf.float64)
-#        T_neighbors = np.split(self.simulation.variables['T'].values \
-#                               [assembly._adjacent_flat],
-#                               assembly._adjacent_cell_starts[1:])
+        if self.T_nodes is None or not np.array_equal(T, self._T_tets):
+            self.T_nodes = fem.nodal_average(assembly.tets, T, len(assembly.nodes),
+                                             weights=assembly.geometry.volumes,
+                                             chunk_size=assembly.chunk_size)
+            
+            #new (possibly non-smooth) temperatures
+            if self.stepper is not None:
+                self.stepper.restart()
+            
+        return self.T_nodes
+            
+    def get_timestep(self):
+        """
+        Returns dt if set, otherwise the stable explicit timestep (Gershgorin
+        bound) times safety, times implicit_multiple for implicit schemes.
+        The bound is kept until the matrices are assembled again.
+        """
         
-        T_n = tf.RaggedTensor.from_row_splits(values=sim.variables['T'].values[assembly._adjacent_flat],
-                                              row_splits=assembly._adjacent_row_splits)
+        self.assemble()
         
-        dt = tf.constant(dt, dtype=tf.float64)
-        c = tf.constant(0.1, dtype=tf.float64)
+        if self.dt is not None:
+            self.timestep = self.dt
+        else:
+            if self._stable_dt is None:
+                self._stable_dt = fem.stable_timestep(self.conductivity,
+                                                      self.capacity, 1.)
+            self.timestep = self.safety*self._stable_dt
+            if self.scheme != 'explicit':
+                self.timestep *= self.implicit_multiple
+        
+        return self.timestep
         
-        T_n_means = tf.math.reduce_mean(T_n, axis=1)
+    def calculate(self, dt):
+        """
+        Advances the temperatures by one step of dt.
+        """
         
-        T_out = T-dt*(T-T_n_means)*c
+        self.assemble()
         
-        self.simulation.variables['T'] = T_out.numpy()
+        self.T_nodes = self.stepper.step(self.nodal_temperatures(), dt)
+        
+        assembly = self.simulation.assembly
+        self._T_tets = fem.element_average(assembly.tets, self.T_nodes,
+                                           chunk_size=assembly.chunk_size)
+        self.simulation.variables['T'] = self._T_tets
         
 class Stress_Strain(Physics_Effect_Base):
     """
-    Attempts a structural model of the assembly
-    (lots of variables, might take some time)
+    Linear elastic structural model of the assembly (linear tets, E and
+    poisson from the materials), solved again for the current loads every
+    step (quasi-static).
+    
+    Boundary conditions are read from Simulation.boundary_conditions:
+    
+    - 'fixed_nodes': nodes with every displacement component fixed to 0
+    - 'fixed_dofs': single components (node*3 + component) fixed to 0
+    - 'nodal_forces': (nodes, (m, 3) forces)
+    - 'gravity': (3,) acceleration of the mass (density) of every tet
+    
+    Element stiffness matrices are built in batches of chunk_size tets and
+    scattered into a block sparse matrix through a precomputed pattern, or
+    applied element by element without a global matrix if matrix_free.
+    The system is solved with the solver and preconditioner options (see
+    pyfea.fea.solvers, Jacobi preconditioned conjugate gradients by
+    default), warm started from the last displacements. Solver statistics
+    are in linear_solver.stats.
+    
+    Writes the von Mises stress ('sigma'), maximum shear stress ('tau')
+    and the stress components of every tet. Nodal displacements are kept
+    in displacements.
     """
     
     timestep = None
-    variables = ['sigma', 'tau']
-    materialprops = ['E']
-    initvar = {'sigma':0, 'tau':0}
-            
+    components = ['sigma_xx', 'sigma_yy', 'sigma_zz', 
+                  'sigma_yz', 'sigma_xz', 'sigma_xy']
+    variables = ['sigma', 'tau'] + components
+    materialprops = ['E', 'poisson']
+    initvar = {name: 0 for name in variables}
+    
+    dt = 0.5 #s
+    
+    solver = 'cg'
+    preconditioner = 'jacobi'
+    
+    #stiffness applied element by element instead of assembled (see
+    #fem.ElementOperator), for iterative solvers
+    matrix_free = False
+    
+    #tets per batch of element matrices
+    chunk_size = 2**18
+    
+    def __init__(self, simulation, **kwargs):
+        super(Stress_Strain, self).__init__(simulation, **kwargs)
+        
+        self.stiffness = None
+        self.elasticity = None
+        self.displacements = None
+        
+        self.linear_solver = self.get_solver()
+        
+        self._pattern = None
+        self._state = None
+        self._reduced = None
+        
     def get_timestep(self):
-        #TODO: Placeholder function
-        self.timestep = 0.5 #s
+        self.timestep = self.dt
         
         return self.timestep
+    
+    def assemble(self):
+        """
+        Assembles the stiffness matrix from the element geometry and the
+        materials of the assembly, if they changed.
+        """
+        
+        state = self.material_state(['E', 'poisson'])
+        if not self.state_changed(self._state, state):
+            return
+        
+        assembly = self.simulation.assembly
+        geometry = assembly.geometry
+        n_nodes = len(assembly.nodes)
+        distinct, inverse = state[2]
+        
+        #one elasticity matrix per distinct material
+        E = fem.material_property(distinct, 'E')
+        poisson = fem.material_property(distinct, 'poisson', default=0.3)
+        self.elasticity = (fem.elasticity_matrices(E, poisson), inverse)
+        
+        D, inverse = self.elasticity
+        
+        if self.matrix_free:
+            self.stiffness = fem.ElementOperator(geometry, n_nodes, D, inverse, 3,
+                                                 self.chunk_size)
+        else:
+            #the pattern only depends on the tets
+            if self._pattern is None or self._pattern[0] is not assembly.tets:
+                self._pattern = (assembly.tets, 
+                                 fem.BlockPattern(assembly.tets, n_nodes, 3, 
+                                                  self.chunk_size))
+            
+            chunks = ((chunk, fem.stiffness_matrices(geometry, D[inverse[chunk]], chunk))
+                      for chunk in assembly.iter_chunks(self.chunk_size))
+            
+            self.stiffness = self._pattern[1].assemble(chunks).tocsr()
+        
+        if self.displacements is None or len(self.displacements) != n_nodes:
+            self.displacements = np.zeros((n_nodes, 3))
+        
+        self._reduced = None
+        self._state = state
+        
+    def fixed_dofs(self):
+        """
+        Returns the sorted fixed degrees of freedom.
+        """
+        
+        bc = self.simulation.boundary_conditions
+        
+        nodes = np.asarray(bc.get('fixed_nodes', []), dtype=np.int64)
+        dofs = np.asarray(bc.get('fixed_dofs', []), dtype=np.int64)
+        
+        return np.union1d((nodes[:, None]*3 + np.arange(3)).ravel(), dofs)
+        
+    def loads(self):
+        """
+        Returns the (n_nodes*3,) load vector of nodal forces and gravity.
+        """
+        
+        bc = self.simulation.boundary_conditions
+        assembly = self.simulation.assembly
+        n_nodes = len(assembly.nodes)
+        
+        f = np.zeros((n_nodes, 3))
         
+        if 'nodal_forces' in bc:
+            nodes, forces = bc['nodal_forces']
+            np.add.at(f, np.asarray(nodes), np.asarray(forces, dtype=np.float64))
+            
+        if 'gravity' in bc:
+            index = self.material_state([])[2]
+            density = fem.material_property(assembly.materials, 'density', 
+                                            default=1., index=index)
+            mass = density*np.abs(assembly.geometry.volumes)/4.
+            
+            lumped = np.bincount(np.asarray(assembly.tets).ravel(), 
+                                 weights=np.repeat(mass, 4), minlength=n_nodes)
+            f += lumped[:, None]*np.asarray(bc['gravity'], dtype=np.float64)
+            
+        return f.ravel()
+    
+    def _reduced_system(self, fixed):
+        """
+        Returns the free dofs and the linear solver set up for the
+        stiffness matrix over the free dofs, kept while the fixed dofs are
+        unchanged.
+        """
+        
+        if self._reduced is None or not np.array_equal(self._reduced[0], fixed):
+            free = np.setdiff1d(np.arange(self.stiffness.shape[0]), fixed)
+            
+            if self.matrix_free:
+                self.linear_solver.setup(fem.RestrictedOperator(self.stiffness, free))
+            else:
+                self.linear_solver.setup(self.stiffness[free][:, free])
+            self._reduced = (fixed, free)
+            
+        return self._reduced[1]
+    
     def calculate(self, dt):
         """
-        Calculates the conduction (currently dummy formula)
+        Solves the displacements for the current loads and writes the
+        element stresses.
         """
         
-        pass
+        self.assemble()
+        
+        fixed = self.fixed_dofs()
+        if len(fixed) == 0:
+            if not getattr(self, '_warned', False):
+                print('WARNING: no fixed nodes, skipping the structural solve')
+                self._warned = True
+            return
+        
+        free = self._reduced_system(fixed)
+        
+        u = np.zeros(self.stiffness.shape[0])
+        u[free] = self.linear_solver.solve(self.loads()[free], 
+                                           x0=self.displacements.ravel()[free])
+        
+        self.displacements = u.reshape(-1, 3)
+        
+        self.write_stresses()
+        
+    def stresses(self, chunk=slice(None)):
+        """
+        Returns the (n, 6) Voigt stresses (xx, yy, zz, yz, xz, xy) of the
+        selected tets from the current displacements.
+        """
+        
+        assembly = self.simulation.assembly
+        D, inverse = self.elasticity
+        
+        B = fem.strain_displacement(assembly.geometry, chunk)
+        u = self.displacements.ravel()[fem.element_dofs(assembly.tets[chunk], 3)]
+        
+        strain = np.einsum('nij,nj->ni', B, u)
+        
+        return np.einsum('nij,nj->ni', D[inverse[chunk]], strain)
+    
+    def write_stresses(self):
+        """
+        Writes the stresses of every tet to the simulation variables.
+        """
+        
+        assembly = self.simulation.assembly
+        n = len(assembly.tets)
+        
+        stress = np.empty((n, 6))
+        sigma, tau = np.empty(n), np.empty(n)
+        
+        for chunk in assembly.iter_chunks(self.chunk_size):
+            stress[chunk] = self.stresses(chunk)
+            sigma[chunk] = fem.von_mises(stress[chunk])
+            tau[chunk] = fem.max_shear(stress[chunk])
+            
+        variables = self.simulation.variables
+        variables['sigma'] = sigma
+        variables['tau'] = tau
+        for index, name in enumerate(self.components):
+            variables[name] = stress[:, index]
         
     
 # %% Testing
@@ -584,7 +970,9 @@ if __name__ == '__main__':
     
     m = Material('AISI 6000 steel',
                  E=207*10**9,
+                 poisson=0.29,
                  Cp=0.475*10**-3,
+                 density=7850,
                  k=46.6)
     
     em = Part(surface_mesh=sm, material=m)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Node smoothing of tet meshes with fixed nodes (eg. the boundary): a
+quality-guarded Laplacian pass and an optimization-based pass that
+minimizes the inverse mean ratio of the elements around each node.
+"""
+
+import numpy as np
+
+from pyfea.fea.topology import TET_FACES, MeshTopology, node_adjacency
+from pyfea.fea.quality import TET_EDGES, mean_ratio_coords
+
+def color_nodes(csr, seed=0):
+    """
+    Colors a graph given as CSR arrays so no two neighbors share a color
+    (Jones-Plassmann, one vectorized round per color). Nodes of one color
+    form an independent set that can be moved at the same time.
+
+    Returns the color of every node.
+    """
+
+    flat, row_splits = csr
+    flat = np.asarray(flat)
+    n = len(row_splits) - 1
+
+    rows = np.repeat(np.arange(n), np.diff(row_splits))
+    priority = np.random.default_rng(seed).permutation(n)
+
+    colors = np.full(n, -1, dtype=np.int64)
+
+    color = 0
+    while np.any(colors < 0):
+        active = colors < 0
+
+        neighbor = np.where(active[flat], priority[flat], -1)
+        highest = np.full(n, -1)
+        np.maximum.at(highest, rows, neighbor)
+
+        colors[active & (priority > highest)] = color
+        color += 1
+
+    return colors
+
+def _per_node(values, rows, n, reduce='sum'):
+    """
+    Reduces per-incidence values to per-node values.
+    """
+
+    if reduce == 'sum':
+        return np.bincount(rows, weights=values, minlength=n)
+
+    out = np.full(n, np.inf)
+    np.minimum.at(out, rows, values)
+    return out
+
+def smooth_laplacian(nodes, tets, fixed, iterations=10, relaxation=0.5):
+    """
+    Moves every free node towards the mean of its edge neighbors
+    (x += relaxation*(mean - x), one sparse product per iteration).
+
+    Moves that lower the worst quality (mean ratio) of the tets around a
+    node are reverted, so the pass never inverts elements.
+
+    Returns the new (n_nodes, 3) nodes.
+    """
+
+    from scipy.sparse import csr_matrix
+
+    nodes = np.array(nodes, dtype=np.float64)
+    tets = np.asarray(tets)
+    n = len(nodes)
+
+    flat, row_splits = node_adjacency(tets, n)
+    adjacency = csr_matrix((np.ones(len(flat)), flat, row_splits), shape=(n, n))
+    degree = np.maximum(np.diff(row_splits), 1)
+
+    free = np.ones(n, dtype=bool)
+    free[fixed] = False
+
+    incidence = tets.ravel()
+
+    def worst(x):
+        q = np.repeat(mean_ratio_coords(x[tets]), 4)
+        return _per_node(q, incidence, n, reduce='min')
+
+    for _ in range(iterations):
+        before = worst(nodes)
+
+        mean = adjacency @ nodes / degree[:, None]
+        moved = nodes.copy()
+        moved[free] += relaxation*(mean[free] - nodes[free])
+
+        #revert nodes until no node's surroundings got worse (ends as every
+        #pass reverts at least one moved node)
+        worse = (worst(moved) < before) & free & np.any(moved != nodes, axis=1)
+        while np.any(worse):
+            moved[worse] = nodes[worse]
+            worse = (worst(moved) < before) & free & np.any(moved != nodes, axis=1)
+
+        nodes = moved
+
+    return nodes
+
+def _node_objective(coords, rows, n_nodes):
+    """
+    Sum of inverse mean ratios and worst mean ratio of the tets around each
+    node (inverted tets count as infinitely bad).
+    """
+
+    q = mean_ratio_coords(coords)
+    with np.errstate(divide='ignore'):
+        inverse = np.where(q > 0, 1/q, np.inf)
+
+    return _per_node(inverse, rows, n_nodes), _per_node(q, rows, n_nodes, reduce='min')
+
+def _objective_gradient(coords, local):
+    """
+    Gradient of 1/q (inverse mean ratio) of each tet with respect to its
+    vertex local:
+
+    d(1/q)/dx = (1/q) (dS/dx / S - 2/3 dV/dx / V), S the sum of squared
+    edge lengths, dV/dx = V grad N (grad N the shape function gradient).
+    """
+
+    m = np.arange(len(coords))
+
+    q = mean_ratio_coords(coords)
+    x = coords[m, local]
+
+    d = coords[:, 1:] - coords[:, :1]
+    volume = np.einsum('ij,ij->i', np.cross(d[:, 0], d[:, 1]), d[:, 2])/6.
+
+    edges = coords[:, TET_EDGES[:, 1]] - coords[:, TET_EDGES[:, 0]]
+    squares = np.einsum('ijk,ijk->i', edges, edges)
+
+    #shape function gradient of the vertex (opposite face area vector)
+    face = coords[m[:, None], TET_FACES[local]]
+    area = np.cross(face[:, 1] - face[:, 0], face[:, 2] - face[:, 0])/2.
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grad_n = -area/(3*volume[:, None])
+        grad = (1/q)[:, None]*(2*(4*x - coords.sum(axis=1))/squares[:, None]
+                               - 2/3.*grad_n)
+
+    grad[~(q > 0)] = 0
+
+    return grad
+
+def smooth_optimize(nodes, tets, fixed, node_to_tet=None, iterations=10,
+                    relaxation=0.5, steps=4, seed=0):
+    """
+    Optimization-based smoothing: every free node takes a gradient step
+    minimizing the sum of inverse mean ratios of the tets around it, with a
+    backtracking line search (relaxation * h * 2**-k for k < steps, h the
+    local element size).
+
+    A step is only accepted if it lowers the objective without lowering the
+    worst quality around the node. Nodes are moved one independent set (see
+    color_nodes) at a time so their evaluations don't interfere.
+
+    Returns the new (n_nodes, 3) nodes.
+    """
+
+    nodes = np.array(nodes, dtype=np.float64)
+    tets = np.asarray(tets)
+    n = len(nodes)
+
+    if node_to_tet is None:
+        node_to_tet = MeshTopology(tets, n).node_to_tet
+
+    flat, row_splits = node_to_tet
+    flat, row_splits = np.asarray(flat), np.asarray(row_splits)
+
+    free = np.ones(n, dtype=bool)
+    free[fixed] = False
+
+    colors = color_nodes(node_adjacency(tets, n), seed=seed)
+    sets = [np.nonzero(free & (colors == c))[0] for c in range(colors.max() + 1)]
+
+    scales = relaxation*0.5**np.arange(steps)
+
+    for _ in range(iterations):
+        for group in sets:
+            if len(group) == 0: continue
+
+            counts = row_splits[group + 1] - row_splits[group]
+            rows = np.repeat(np.arange(len(group)), counts)
+            incident = flat[np.arange(counts.sum())
+                            + np.repeat(row_splits[group] - np.r_[0, np.cumsum(counts)[:-1]],
+                                        counts)]
+
+            local = np.argmax(tets[incident] == group[rows][:, None], axis=1)
+            m = np.arange(len(incident))
+
+            coords = nodes[tets[incident]]
+            objective, worst = _node_objective(coords, rows, len(group))
+
+            grad = _objective_gradient(coords, local)
+            grad = np.stack([np.bincount(rows, weights=grad[:, k], minlength=len(group))
+                             for k in range(3)], axis=1)
+            norm = np.linalg.norm(grad, axis=1)
+
+            #local size: edge of the regular tet of the mean incident volume
+            volume = np.abs(np.linalg.det(coords[:, 1:] - coords[:, :1]))/6.
+            h = np.cbrt(6*np.sqrt(2)*_per_node(volume, rows, len(group))
+                        / np.maximum(counts, 1))
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                direction = np.where(norm[:, None] > 0, -grad/norm[:, None], 0)*h[:, None]
+
+            #nodes of inverted tets (no gradient) move towards the centroid
+            #of their patch instead, accepted if the worst tet improves
+            tangled = np.isinf(objective)
+            if np.any(tangled):
+                centroid = np.stack([_per_node(coords.mean(axis=1)[:, k], rows, len(group))
+                                     for k in range(3)], axis=1)/np.maximum(counts, 1)[:, None]
+                direction[tangled] = 2*(centroid - nodes[group])[tangled]
+
+            best, best_worst = objective.copy(), worst.copy()
+            position = nodes[group]
+            for scale in scales:
+                candidate = nodes[group] + scale*direction
+                coords[m, local] = candidate[rows]
+
+                trial, trial_worst = _node_objective(coords, rows, len(group))
+                accept = ((trial < best) & (trial_worst >= worst)) \
+                       | (tangled & (trial_worst > best_worst))
+
+                best[accept] = trial[accept]
+                best_worst[accept] = trial_worst[accept]
+                position[accept] = candidate[accept]
+
+            nodes[group] = position
+
+    return nodes
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse linear solver backends for the physics effects.
+
+Solvers are classes named <name>_solver and preconditioners classes named
+<name>_preconditioner (found by suffix like the meshing interfaces), other
+backends can be added with register. Every solver keeps statistics of its
+last setup and solve (iterations, residual, setup and solve times).
+"""
+
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+class preconditioner_base(ABC):
+    """
+    Base class of preconditioners, setup returns a LinearOperator
+    approximating the inverse of the matrix.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    @abstractmethod
+    def setup(self, matrix):
+        pass
+
+class jacobi_preconditioner(preconditioner_base):
+    """
+    Inverse of the diagonal.
+    """
+
+    def setup(self, matrix):
+        from scipy.sparse.linalg import LinearOperator
+
+        diagonal = matrix.diagonal()
+        inverse = np.divide(1., diagonal, out=np.ones_like(diagonal),
+                            where=diagonal != 0)
+
+        return LinearOperator(matrix.shape, matvec=lambda x: inverse*x.ravel(),
+                              dtype=matrix.dtype)
+
+class ilu_preconditioner(preconditioner_base):
+    """
+    Incomplete LU factorization (scipy spilu), options are passed to
+    spilu (eg. drop_tol, fill_factor). The factors are not symmetric, use
+    it with gmres or bicgstab rather than cg.
+    """
+
+    def setup(self, matrix):
+        from scipy.sparse.linalg import LinearOperator, spilu
+
+        ilu = spilu(matrix.tocsc(), **self.options)
+
+        return LinearOperator(matrix.shape, matvec=ilu.solve, dtype=matrix.dtype)
+
+class amg_preconditioner(preconditioner_base):
+    """
+    Smoothed aggregation algebraic multigrid V-cycle (requires pyamg),
+    options are passed to pyamg.smoothed_aggregation_solver. Falls back to
+    jacobi without pyamg.
+    """
+
+    _fallback = None
+
+    def setup(self, matrix):
+        try:
+            import pyamg
+        except ImportError:
+            print('WARNING: pyamg is not installed, using the jacobi preconditioner')
+            self._fallback = jacobi_preconditioner()
+            return self._fallback.setup(matrix)
+
+        self._fallback = None
+        hierarchy = pyamg.smoothed_aggregation_solver(matrix.tocsr(), **self.options)
+
+        return hierarchy.aspreconditioner(cycle='V')
+
+class solver_base(ABC):
+    """
+    Base class of linear solvers. setup factorizes (direct solvers) or
+    prepares the preconditioner (iterative solvers) of a matrix once, solve
+    can then be called for any number of right hand sides.
+
+    stats holds the solver and preconditioner names (of the backends
+    actually used when one falls back to another), iterations
+    (approximate, see _krylov_solver),
+    relative residual |b - Ax|/|b|, convergence, setup_time and
+    solve_time of the last setup and solve, and the number of setups
+    and solves so far.
+    """
+
+    iterative = False
+
+    matrix = None
+
+    def __init__(self, preconditioner=None, tolerance=1e-8,
+                 max_iterations=None, preconditioner_options=None, **options):
+        """
+        preconditioner is a name (see available, created with
+        preconditioner_options) or a preconditioner instance, options are
+        passed to the backend.
+        """
+
+        #direct solvers are not preconditioned
+        if not self.iterative:
+            preconditioner = None
+        elif isinstance(preconditioner, str):
+            preconditioner = available('preconditioner')[preconditioner](
+                **(preconditioner_options or {}))
+
+        self.preconditioner = preconditioner
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.options = options
+
+        self.stats = {'solver': _name(self, 'solver'),
+                      'preconditioner': _name(preconditioner, 'preconditioner'),
+                      'iterations': 0,
+                      'residual': None,
+                      'converged': None,
+                      'setup_time': 0.,
+                      'solve_time': 0.,
+                      'setups': 0,
+                      'solves': 0}
+
+    def setup(self, matrix):
+        """
+        Prepares the solver for a sparse matrix.
+        """
+
+        start = time.perf_counter()
+
+        self.matrix = matrix
+        self._setup(matrix)
+
+        self.stats['solver'] = _name(self, 'solver')
+        self.stats['preconditioner'] = _name(self.preconditioner, 'preconditioner')
+
+        self.stats['setup_time'] = time.perf_counter() - start
+        self.stats['setups'] += 1
+
+        return self
+
+    def solve(self, b, x0=None):
+        """
+        Returns the solution x of matrix x = b.
+        """
+
+        assert self.matrix is not None, 'Solver is not set up.'
+
+        start = time.perf_counter()
+
+        x, iterations, converged = self._solve(b, x0)
+
+        self.stats['solve_time'] = time.perf_counter() - start
+        self.stats['solves'] += 1
+
+        norm = np.linalg.norm(b)
+        residual = np.linalg.norm(b - self.matrix @ x)
+        self.stats['residual'] = residual/norm if norm > 0 else residual
+        self.stats['iterations'] = iterations
+        self.stats['converged'] = converged
+
+        if not converged:
+            print('WARNING: ' + self.stats['solver'] + ' did not converge in '
+                  + str(iterations) + ' iterations (residual '
+                  + '{:.3g}'.format(self.stats['residual']) + ')')
+
+        return x
+
+    def summary(self):
+        """
+        Returns the stats of the last setup and solve as one line.
+        """
+
+        s = self.stats
+        residual = 'n/a' if s['residual'] is None else '{:.3g}'.format(s['residual'])
+
+        return '{} ({}): {} iterations, residual {}, setup {:.3g} s, ' \
+               'solve {:.3g} s'.format(s['solver'], s['preconditioner'],
+                                       s['iterations'], residual,
+                                       s['setup_time'], s['solve_time'])
+
+    @abstractmethod
+    def _setup(self, matrix):
+        pass
+
+    @abstractmethod
+    def _solve(self, b, x0):
+        pass
+
+class lu_solver(solver_base):
+    """
+    Sparse direct LU factorization (scipy splu, SuperLU).
+    """
+
+    def _setup(self, matrix):
+        from scipy.sparse.linalg import splu
+
+        self._lu = splu(matrix.tocsc(), **self.options)
+
+    def _solve(self, b, x0):
+        return self._lu.solve(b), 0, True
+
+class cholesky_solver(solver_base):
+    """
+    Sparse direct Cholesky factorization of symmetric positive definite
+    matrices (requires scikit-sparse, CHOLMOD). Falls back to lu without
+    scikit-sparse.
+    """
+
+    _fallback = None
+
+    def _setup(self, matrix):
+        try:
+            from sksparse.cholmod import cholesky
+        except ImportError:
+            print('WARNING: scikit-sparse is not installed, using the lu solver')
+            self._fallback = lu_solver().setup(matrix)
+            return
+
+        self._fallback = None
+        self._factor = cholesky(matrix.tocsc(), **self.options)
+
+    def _solve(self, b, x0):
+        if self._fallback is not None:
+            return self._fallback.solve(b), 0, True
+        return self._factor(b), 0, True
+
+class _krylov_solver(solver_base):
+    """
+    Shared setup and solve of the scipy Krylov solvers.
+
+    Iterations are approximate: counted from the backend callbacks, from
+    preconditioner applications if preconditioner_solves is set (for
+    methods returning before their callback), or taken from the backend
+    info when it stops at max_iterations.
+    """
+
+    iterative = True
+
+    #preconditioner applications per iteration, to count iterations
+    preconditioner_solves = None
+
+    @abstractmethod
+    def _method(self):
+        pass
+
+    def _setup(self, matrix):
+        self._operator = None if self.preconditioner is None \
+                         else self.preconditioner.setup(matrix)
+
+    def _solve(self, b, x0):
+        from scipy.sparse.linalg import LinearOperator
+
+        count = [0]
+        def callback(*args):
+            count[0] += 1
+
+        operator = self._operator
+        solves = [0]
+        if self.preconditioner_solves:
+            inner = operator
+            def apply(x):
+                solves[0] += 1
+                return x if inner is None else inner.matvec(x)
+            operator = LinearOperator(self.matrix.shape, matvec=apply,
+                                      dtype=self.matrix.dtype)
+
+        x, info = self._method()(self.matrix, b, x0=x0, rtol=self.tolerance,
+                                 atol=0., maxiter=self.max_iterations,
+                                 M=operator, callback=callback,
+                                 **self.options)
+
+        iterations = count[0]
+        if self.preconditioner_solves:
+            iterations = -(-solves[0]//self.preconditioner_solves)
+        if info > 0:
+            iterations = info
+
+        return x, iterations, info == 0
+
+class cg_solver(_krylov_solver):
+    """
+    Preconditioned conjugate gradients (symmetric positive definite
+    matrices and preconditioners, eg. jacobi or amg).
+    """
+
+    def _method(self):
+        from scipy.sparse.linalg import cg
+        return cg
+
+class gmres_solver(_krylov_solver):
+    """
+    Restarted GMRES (any nonsingular matrix), iterations are inner
+    iterations.
+    """
+
+    def _method(self):
+        from scipy.sparse.linalg import gmres
+
+        def method(*args, **kwargs):
+            return gmres(*args, callback_type='pr_norm', **kwargs)
+        return method
+
+class bicgstab_solver(_krylov_solver):
+    """
+    BiCGSTAB (any nonsingular matrix), may converge half way through an
+    iteration (before its callback).
+    """
+
+    preconditioner_solves = 2
+
+    def _method(self):
+        from scipy.sparse.linalg import bicgstab
+        return bicgstab
+
+_registered = {'solver': {}, 'preconditioner': {}}
+
+def _name(instance, kind):
+    """
+    Name of a solver or preconditioner instance (without the suffix), or
+    of the backend it fell back to.
+    """
+
+    if instance is None:
+        return 'none'
+
+    if getattr(instance, '_fallback', None) is not None:
+        return _name(instance._fallback, kind)
+
+    name = type(instance).__name__
+    suffix = '_' + kind
+
+    return name[:-len(suffix)] if name.endswith(suffix) else name
+
+def register(cls, name=None, kind=None):
+    """
+    Registers a solver (solver_base subclass) or preconditioner
+    (preconditioner_base subclass) under name, which defaults to the class
+    name without its _solver/_preconditioner suffix.
+    """
+
+    import inspect
+
+    if kind is None:
+        kind = 'solver' if issubclass(cls, solver_base) else 'preconditioner'
+
+    assert kind in _registered, 'kind must be "solver" or "preconditioner"'
+    assert not inspect.isabstract(cls), cls.__name__ + ' does not implement ' \
+        + ', '.join(sorted(cls.__abstractmethods__))
+
+    if name is None:
+        suffix = '_' + kind
+        name = cls.__name__[:-len(suffix)] if cls.__name__.endswith(suffix) \
+               else cls.__name__
+
+    _registered[kind][name] = cls
+
+    return cls
+
+def available(kind='solver'):
+    """
+    Returns the {name: class} of the solvers or preconditioners of this
+    module and the registered ones.
+    """
+
+    import inspect
+    import sys
+
+    suffix = '_' + kind
+    module = sys.modules[__name__]
+
+    classes = {}
+    for name, cls in inspect.getmembers(module, inspect.isclass):
+        if name.endswith(suffix) and not name.startswith('_') \
+           and cls.__module__ == __name__ and name != kind + '_base':
+            classes[name[:-len(suffix)]] = cls
+
+    classes.update(_registered[kind])
+
+    return classes
+
+def get_solver(solver='lu', preconditioner=None, **options):
+    """
+    Returns a solver instance by name, with a preconditioner by name
+    (iterative solvers) and options (tolerance, max_iterations,
+    preconditioner_options and options of the backend functions).
+    """
+
+    solvers = available('solver')
+    assert solver in solvers, 'Unknown solver "' + str(solver) + '", ' \
+                              'available: ' + str(list(solvers))
+
+    if preconditioner is not None and isinstance(preconditioner, str):
+        preconditioners = available('preconditioner')
+        assert preconditioner in preconditioners, \
+            'Unknown preconditioner "' + preconditioner + '", available: ' \
+            + str(list(preconditioners))
+
+    return solvers[solver](preconditioner=preconditioner, **options)
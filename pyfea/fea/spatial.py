@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial index over tetrahedra. A bounding volume hierarchy of axis aligned
+bounding boxes built from Morton-sorted element centroids, queried in
+batches one tree level at a time (no per-query python loops).
+"""
+
+import numpy as np
+
+from pyfea.fea.topology import TET_FACES
+
+def _spread_bits(x):
+    """
+    Inserts two zero bits between each of the low 21 bits of x (uint64).
+    """
+
+    x = x & np.uint64(0x1fffff)
+    x = (x | x << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    x = (x | x << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    x = (x | x << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    x = (x | x << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    x = (x | x << np.uint64(2)) & np.uint64(0x1249249249249249)
+
+    return x
+
+def quantize(points, bits=21):
+    """
+    Maps (n, 3) points to integer grid coordinates in [0, 2**bits) over
+    their bounding box.
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+
+    lo = points.min(axis=0)
+    span = points.max(axis=0) - lo
+    span[span == 0] = 1
+
+    scale = 2**bits - 1
+
+    return ((points - lo) / span * scale).astype(np.uint64)
+
+def morton_codes(points, bits=21):
+    """
+    Returns the Morton (Z-order) codes of (n, 3) points, nearby points get
+    nearby codes.
+    """
+
+    grid = quantize(points, bits)
+
+    return _spread_bits(grid[:, 0]) \
+         | (_spread_bits(grid[:, 1]) << np.uint64(1)) \
+         | (_spread_bits(grid[:, 2]) << np.uint64(2))
+
+def hilbert_codes(points, bits=21):
+    """
+    Returns the Hilbert curve indices of (n, 3) points (Skilling's
+    transpose algorithm, vectorized over points). Consecutive indices are
+    always neighboring grid cells, unlike Morton codes.
+    """
+
+    X = [x.copy() for x in quantize(points, bits).T]
+    one = np.uint64(1)
+    M = one << np.uint64(bits - 1)
+
+    #inverse undo
+    Q = M
+    while Q > one:
+        P = Q - one
+        for i in range(3):
+            flip = (X[i] & Q) != 0
+            X[0] = np.where(flip, X[0] ^ P, X[0])
+            t = np.where(flip, 0, (X[0] ^ X[i]) & P).astype(np.uint64)
+            X[0] ^= t
+            X[i] ^= t
+        Q >>= one
+
+    #gray encode
+    for i in range(1, 3):
+        X[i] ^= X[i-1]
+    t = np.zeros_like(X[0])
+    Q = M
+    while Q > one:
+        t = np.where((X[2] & Q) != 0, t ^ (Q - one), t)
+        Q >>= one
+    for i in range(3):
+        X[i] ^= t
+
+    return (_spread_bits(X[0]) << np.uint64(2)) \
+         | (_spread_bits(X[1]) << np.uint64(1)) \
+         | _spread_bits(X[2])
+
+def _csr(query, values, n_queries):
+    """
+    Groups (query, value) pairs into CSR arrays (flat, row_splits).
+    """
+
+    order = np.argsort(query, kind='stable')
+    counts = np.bincount(query, minlength=n_queries)
+
+    row_splits = np.zeros(n_queries + 1, dtype=np.int64)
+    np.cumsum(counts, out=row_splits[1:])
+
+    return values[order], row_splits
+
+def barycentric(coords, points):
+    """
+    Returns the (n, 4) barycentric coordinates of points with respect to
+    tets with (n, 4, 3) vertex coordinates (nan for degenerate tets).
+    """
+
+    e = coords[:, 1:] - coords[:, :1]
+    d = points - coords[:, 0]
+
+    c23 = np.cross(e[:, 1], e[:, 2])
+    volume = np.einsum('ij,ij->i', e[:, 0], c23)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        l1 = np.einsum('ij,ij->i', d, c23) / volume
+        l2 = np.einsum('ij,ij->i', e[:, 0], np.cross(d, e[:, 2])) / volume
+        l3 = np.einsum('ij,ij->i', e[:, 0], np.cross(e[:, 1], d)) / volume
+
+    return np.stack([1 - l1 - l2 - l3, l1, l2, l3], axis=1)
+
+def closest_point_triangle(points, a, b, c):
+    """
+    Returns the closest points on triangles (a, b, c) to points, all (n, 3)
+    (Ericson, Real-Time Collision Detection 5.1.5, vectorized).
+    """
+
+    ab, ac, ap = b - a, c - a, points - a
+    bp, cp = points - b, points - c
+
+    dot = lambda u, v: np.einsum('ij,ij->i', u, v)
+
+    d1, d2 = dot(ab, ap), dot(ac, ap)
+    d3, d4 = dot(ab, bp), dot(ac, bp)
+    d5, d6 = dot(ab, cp), dot(ac, cp)
+
+    va = d3*d6 - d5*d4
+    vb = d5*d2 - d1*d6
+    vc = d1*d4 - d3*d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        #interior of the face
+        denom = va + vb + vc
+        v = vb / denom
+        w = vc / denom
+        result = a + ab*v[:, None] + ac*w[:, None]
+
+        #edge and vertex regions, assigned from the lowest priority up so
+        #the checks resolve in the same order as the scalar algorithm
+        bc_t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        mask = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        result[mask] = (b + (c - b)*bc_t[:, None])[mask]
+
+        ac_t = d2 / (d2 - d6)
+        mask = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        result[mask] = (a + ac*ac_t[:, None])[mask]
+
+        mask = (d6 >= 0) & (d5 <= d6)
+        result[mask] = c[mask]
+
+        ab_t = d1 / (d1 - d3)
+        mask = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        result[mask] = (a + ab*ab_t[:, None])[mask]
+
+    mask = (d3 >= 0) & (d4 <= d3)
+    result[mask] = b[mask]
+    mask = (d1 <= 0) & (d2 <= 0)
+    result[mask] = a[mask]
+
+    return result
+
+def point_tet_distance(coords, points, tolerance=1e-12):
+    """
+    Returns the distances from points to tets with (n, 4, 3) vertex
+    coordinates (zero inside).
+    """
+
+    inside = np.all(barycentric(coords, points) >= -tolerance, axis=1)
+
+    distance = np.full(len(points), np.inf)
+    for face in TET_FACES:
+        closest = closest_point_triangle(points, coords[:, face[0]],
+                                         coords[:, face[1]],
+                                         coords[:, face[2]])
+        np.minimum(distance, np.linalg.norm(points - closest, axis=1),
+                   out=distance)
+
+    distance[inside] = 0
+
+    return distance
+
+def ray_tet_intersection(coords, origins, directions):
+    """
+    Clips rays against the four face planes of tets with (n, 4, 3) vertex
+    coordinates. Returns (t_enter, t_exit), the ray misses when
+    t_enter > t_exit.
+    """
+
+    t_enter = np.full(len(origins), -np.inf)
+    t_exit = np.full(len(origins), np.inf)
+
+    for j, face in enumerate(TET_FACES):
+        p0 = coords[:, face[0]]
+        normal = np.cross(coords[:, face[1]] - p0, coords[:, face[2]] - p0)
+
+        #orient the normal away from the opposite vertex
+        side = np.einsum('ij,ij->i', normal, coords[:, j] - p0)
+        normal[side > 0] *= -1
+
+        denom = np.einsum('ij,ij->i', normal, directions)
+        dist = np.einsum('ij,ij->i', normal, p0 - origins)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = dist / denom
+
+        entering = denom < 0
+        exiting = denom > 0
+        parallel_outside = (denom == 0) & (dist < 0)
+
+        t_enter[entering] = np.maximum(t_enter[entering], t[entering])
+        t_exit[exiting] = np.minimum(t_exit[exiting], t[exiting])
+        t_exit[parallel_outside] = -np.inf
+
+    return t_enter, t_exit
+
+class TetBVH:
+    """
+    Bounding volume hierarchy of tetrahedra.
+
+    Elements are sorted along a Morton curve of their centroids and grouped
+    into leaves of leaf_size elements. The tree is implicit and balanced
+    (node i of a level has children 2i and 2i+1 on the next one), each level
+    being a pair of (m, 3) bounding box arrays. Queries walk the tree for
+    all query items at once, so a batch of q queries costs roughly
+    q*log(n) box tests.
+    """
+
+    nodes = None
+    tets = None
+    leaf_size = None
+    order = None
+    lower = None
+    upper = None
+    levels = None
+
+    def __init__(self, nodes, tets, leaf_size=8):
+        """
+        Builds the hierarchy from (n_nodes, 3) nodes and (n, 4) tets.
+        """
+
+        self.nodes = np.asarray(nodes, dtype=np.float64)
+        self.tets = np.asarray(tets)
+        self.leaf_size = leaf_size
+
+        n = len(self.tets)
+        coords = self.nodes[self.tets]
+
+        self.lower = coords.min(axis=1)
+        self.upper = coords.max(axis=1)
+
+        self.order = np.argsort(morton_codes(coords.mean(axis=1)), kind='stable') \
+                     if n else np.zeros(0, dtype=np.int64)
+
+        n_leaves = max(-(-n // leaf_size), 1)
+        depth = int(np.ceil(np.log2(n_leaves)))
+        padded = 2**depth
+
+        #leaf boxes, padding leaves are empty (inf, -inf) boxes
+        lower = np.full((padded*leaf_size, 3), np.inf)
+        upper = np.full((padded*leaf_size, 3), -np.inf)
+        lower[:n] = self.lower[self.order]
+        upper[:n] = self.upper[self.order]
+
+        lower = lower.reshape(padded, leaf_size, 3).min(axis=1)
+        upper = upper.reshape(padded, leaf_size, 3).max(axis=1)
+
+        #(lower, upper, number of non-empty nodes) from the leaves to the root
+        levels = [(lower, upper, n_leaves)]
+        while len(lower) > 1:
+            lower = np.minimum(lower[0::2], lower[1::2])
+            upper = np.maximum(upper[0::2], upper[1::2])
+            levels.append((lower, upper, -(-levels[-1][2] // 2)))
+
+        self.levels = levels[::-1]
+
+    def __len__(self):
+        return len(self.tets)
+
+    @property
+    def depth(self):
+        return len(self.levels) - 1
+
+    def _traverse(self, n_queries, test):
+        """
+        Walks the tree for all queries. test(query, lower, upper) returns a
+        mask of the (query, box) pairs to descend into.
+
+        Returns the (query, tet) candidate pairs of the reached leaves, tested
+        against the element boxes.
+        """
+
+        query = np.arange(n_queries)
+        node = np.zeros(n_queries, dtype=np.int64)
+
+        for level, (lower, upper, count) in enumerate(self.levels):
+            if level:
+                query = np.repeat(query, 2)
+                node = (2*node[:, None] + np.arange(2)).ravel()
+
+                keep = node < count
+                query, node = query[keep], node[keep]
+
+            keep = test(query, lower[node], upper[node])
+            query, node = query[keep], node[keep]
+
+        #leaves to elements
+        query = np.repeat(query, self.leaf_size)
+        position = (self.leaf_size*node[:, None]
+                    + np.arange(self.leaf_size)).ravel()
+
+        keep = position < len(self.tets)
+        query, tet = query[keep], self.order[position[keep]]
+
+        keep = test(query, self.lower[tet], self.upper[tet])
+
+        return query[keep], tet[keep]
+
+    def query_box(self, lower, upper):
+        """
+        Finds the tets whose bounding boxes overlap (q, 3) query boxes.
+
+        Returns CSR arrays (flat, row_splits), the tets of query i being
+        flat[row_splits[i]:row_splits[i+1]].
+        """
+
+        lower = np.atleast_2d(lower)
+        upper = np.atleast_2d(upper)
+
+        def test(query, box_lower, box_upper):
+            return np.all((lower[query] <= box_upper)
+                          & (box_lower <= upper[query]), axis=1)
+
+        query, tet = self._traverse(len(lower), test)
+
+        return _csr(query, tet, len(lower))
+
+    def locate_points(self, points, tolerance=1e-9, return_barycentric=False):
+        """
+        Finds the tet containing each of the (q, 3) points (-1 outside the
+        mesh). Optionally returns the (q, 4) barycentric coordinates in the
+        found tets, for interpolating nodal fields.
+        """
+
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        pad = tolerance * max(np.ptp(self.nodes, axis=0).max(), 1) \
+              if len(self.nodes) else 0
+
+        def test(query, box_lower, box_upper):
+            p = points[query]
+            return np.all((box_lower - pad <= p) & (p <= box_upper + pad), axis=1)
+
+        query, tet = self._traverse(len(points), test)
+
+        bary = barycentric(self.nodes[self.tets[tet]], points[query])
+        inside = np.all(bary >= -tolerance, axis=1)
+        query, tet, bary = query[inside], tet[inside], bary[inside]
+
+        #first hit per point (lowest tet index on shared faces)
+        order = np.lexsort((tet, query))
+        query, tet, bary = query[order], tet[order], bary[order]
+        first = np.r_[True, query[1:] != query[:-1]]
+
+        result = np.full(len(points), -1, dtype=np.int64)
+        result[query[first]] = tet[first]
+
+        if return_barycentric:
+            weights = np.full((len(points), 4), np.nan)
+            weights[query[first]] = bary[first]
+            return result, weights
+
+        return result
+
+    def query_ray(self, origins, directions, t_max=np.inf):
+        """
+        Finds the tets crossed by rays origin + t*direction, 0 <= t <= t_max.
+
+        Returns CSR arrays (flat, row_splits, t_enter), the tets of ray i
+        sorted by entry distance.
+        """
+
+        origins = np.atleast_2d(np.asarray(origins, dtype=np.float64))
+        directions = np.atleast_2d(np.asarray(directions, dtype=np.float64))
+        directions = np.broadcast_to(directions, origins.shape)
+        t_max = np.broadcast_to(t_max, len(origins))
+
+        with np.errstate(divide='ignore'):
+            inverse = 1 / directions
+
+        def test(query, box_lower, box_upper):
+            o, inv = origins[query], inverse[query]
+            with np.errstate(invalid='ignore'):
+                t1 = (box_lower - o) * inv
+                t2 = (box_upper - o) * inv
+            #axes the ray is parallel to only clip if the origin is outside
+            parallel = directions[query] == 0
+            inside = (box_lower <= o) & (o <= box_upper)
+            near = np.where(parallel, np.where(inside, -np.inf, np.inf),
+                            np.minimum(t1, t2)).max(axis=1)
+            far = np.where(parallel, np.where(inside, np.inf, -np.inf),
+                           np.maximum(t1, t2)).min(axis=1)
+            return (near <= far) & (far >= 0) & (near <= t_max[query])
+
+        query, tet = self._traverse(len(origins), test)
+
+        t_enter, t_exit = ray_tet_intersection(self.nodes[self.tets[tet]],
+                                               origins[query], directions[query])
+        t_enter = np.maximum(t_enter, 0)
+        hit = (t_enter <= t_exit) & (t_enter <= t_max[query])
+        query, tet, t_enter = query[hit], tet[hit], t_enter[hit]
+
+        order = np.lexsort((t_enter, query))
+        query, tet, t_enter = query[order], tet[order], t_enter[order]
+
+        counts = np.bincount(query, minlength=len(origins))
+        row_splits = np.zeros(len(origins) + 1, dtype=np.int64)
+        np.cumsum(counts, out=row_splits[1:])
+
+        return tet, row_splits, t_enter
+
+    def nearest(self, points, return_distance=False):
+        """
+        Finds the nearest tet to each of the (q, 3) points (distance zero
+        inside), branch and bound on box distances.
+        """
+
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        n = len(points)
+
+        def box_distance(p, box_lower, box_upper):
+            gap = np.maximum(np.maximum(box_lower - p, p - box_upper), 0)
+            return np.linalg.norm(gap, axis=1)
+
+        #upper bound from a greedy descent to one leaf per point
+        node = np.zeros(n, dtype=np.int64)
+        for lower, upper, count in self.levels[1:]:
+            children = 2*node[:, None] + np.arange(2)
+            d = np.stack([box_distance(points, lower[children[:, k]],
+                                       upper[children[:, k]])
+                          for k in range(2)], axis=1)
+            d[children >= count] = np.inf
+            node = children[np.arange(n), np.argmin(d, axis=1)]
+
+        query = np.repeat(np.arange(n), self.leaf_size)
+        position = (self.leaf_size*node[:, None]
+                    + np.arange(self.leaf_size)).ravel()
+        keep = position < len(self.tets)
+        query, tet = query[keep], self.order[position[keep]]
+
+        bound = np.full(n, np.inf)
+        np.minimum.at(bound, query,
+                      point_tet_distance(self.nodes[self.tets[tet]], points[query]))
+
+        def test(query, box_lower, box_upper):
+            return box_distance(points[query], box_lower, box_upper) <= bound[query]
+
+        query, tet = self._traverse(n, test)
+
+        distance = point_tet_distance(self.nodes[self.tets[tet]], points[query])
+
+        order = np.lexsort((tet, distance, query))
+        query, tet, distance = query[order], tet[order], distance[order]
+        first = np.r_[True, query[1:] != query[:-1]]
+
+        result = np.full(n, -1, dtype=np.int64)
+        result[query[first]] = tet[first]
+
+        if return_distance:
+            dist = np.full(n, np.inf)
+            dist[query[first]] = distance[first]
+            return result, dist
+
+        return result
@@ -0,0 +1,720 @@
+# -*- coding: utf-8 -*-
+"""
+Mesh connectivity helpers (face pairing, adjacency) built on numpy sorts
+instead of dense tet x tet comparisons.
+"""
+
+import os
+import tempfile
+import numpy as np
+
+#Local vertex indices of the face opposite each vertex of a tetrahedron,
+#ordered so the normal points outwards for a positively oriented tet.
+TET_FACES = np.array([[1, 2, 3],
+                      [0, 3, 2],
+                      [0, 1, 3],
+                      [0, 2, 1]])
+
+def tet_faces(tets):
+    """
+    Returns the (n*4, 3) array of face nodes of every tet, face 4*i+j being
+    the face of tet i opposite its j-th vertex.
+    """
+
+    tets = np.asarray(tets)
+
+    return tets[:, TET_FACES].reshape(-1, 3)
+
+def face_keys(faces):
+    """
+    Sorts the nodes of each face so shared faces compare equal regardless
+    of orientation.
+    """
+
+    return np.sort(faces, axis=1)
+
+def _sort_faces(keys):
+    """
+    Returns the order sorting face keys lexicographically.
+    """
+
+    keys = np.asarray(keys)
+
+    #pack the three node ids in one int64 when they fit, one sort instead of three
+    if len(keys) and keys.max() < 2**21:
+        k = keys.astype(np.int64)
+        packed = (k[:, 0] << 42) | (k[:, 1] << 21) | k[:, 2]
+        return np.argsort(packed, kind='stable')
+
+    return np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+
+def match_faces(faces):
+    """
+    Pairs identical faces.
+
+    Returns (first, second, unmatched) where first[i] and second[i] are the
+    indices (into faces) of the two copies of an interior face and unmatched
+    holds the indices of faces that only appear once (boundary faces).
+    Conforming meshes share a face between at most two tets, additional
+    copies of a face are treated as unmatched.
+    """
+
+    keys = face_keys(faces)
+    order = _sort_faces(keys)
+    skeys = keys[order]
+
+    same = np.all(skeys[1:] == skeys[:-1], axis=1)
+
+    #only keep the first pair of any run of equal faces
+    if len(same) > 1:
+        same[1:] &= ~same[:-1]
+
+    first = order[:-1][same]
+    second = order[1:][same]
+
+    matched = np.zeros(len(faces), dtype=bool)
+    matched[first] = True
+    matched[second] = True
+    unmatched = np.nonzero(~matched)[0]
+
+    return first, second, unmatched
+
+def pairs_to_csr(a, b, n, dtype=np.int32):
+    """
+    Builds symmetric CSR arrays (flat, row_splits) from undirected pairs
+    (a[i], b[i]) over n rows, neighbors sorted within each row.
+    """
+
+    rows = np.concatenate([a, b])
+    cols = np.concatenate([b, a])
+
+    order = np.lexsort((cols, rows))
+    flat = cols[order].astype(dtype)
+
+    counts = np.bincount(rows, minlength=n)
+    row_splits = np.zeros(n+1, dtype=dtype)
+    np.cumsum(counts, out=row_splits[1:])
+
+    return flat, row_splits
+
+def concatenate_csr(arrays, offsets, dtype=np.int32):
+    """
+    Stacks CSR arrays (flat, row_splits) block-diagonally in one pass,
+    offsets[i] is added to the values of block i.
+    """
+
+    n_flat = sum(len(flat) for flat, _ in arrays)
+    n_rows = sum(len(row_splits) - 1 for _, row_splits in arrays)
+
+    flat = np.empty(n_flat, dtype=dtype)
+    row_splits = np.empty(n_rows + 1, dtype=dtype)
+
+    i = j = 0
+    for (f, r), offset in zip(arrays, offsets):
+        flat[i:i+len(f)] = f
+        flat[i:i+len(f)] += offset
+        row_splits[j:j+len(r)-1] = r[:-1]
+        row_splits[j:j+len(r)-1] += i
+        i += len(f)
+        j += len(r) - 1
+    row_splits[-1] = i
+
+    return flat, row_splits
+
+def permute_csr(csr, order, inverse=None, dtype=np.int32):
+    """
+    Reorders the rows of CSR arrays (new row i is old row order[i]) and
+    relabels the values with inverse (old index -> new index) if given,
+    values are sorted within each row.
+    """
+
+    flat, row_splits = csr
+    flat, row_splits = np.asarray(flat), np.asarray(row_splits)
+
+    counts = np.diff(row_splits)[order]
+    new_splits = np.zeros(len(order) + 1, dtype=dtype)
+    np.cumsum(counts, out=new_splits[1:])
+
+    rows = np.repeat(np.arange(len(order)), counts)
+    gather = np.arange(new_splits[-1]) + np.repeat(row_splits[order]
+                                                   - new_splits[:-1], counts)
+
+    values = flat[gather]
+    if inverse is not None:
+        values = inverse[values]
+    values = values[np.lexsort((values, rows))].astype(dtype)
+
+    return values, new_splits
+
+def node_adjacency(tets, n_nodes=None):
+    """
+    Finds the edge-connected neighbors of each node (the node graph of
+    assembled nodal matrices).
+
+    Returns the CSR arrays (flat, row_splits).
+    """
+
+    tets = np.asarray(tets)
+    if n_nodes is None: n_nodes = int(tets.max()) + 1 if len(tets) else 0
+
+    a = tets[:, [0, 0, 0, 1, 1, 2]].ravel().astype(np.int64)
+    b = tets[:, [1, 2, 3, 2, 3, 3]].ravel().astype(np.int64)
+
+    edges = np.unique(np.minimum(a, b)*n_nodes + np.maximum(a, b))
+
+    return pairs_to_csr(edges // n_nodes, edges % n_nodes, n_nodes)
+
+def rcm_order(csr):
+    """
+    Reverse Cuthill-McKee ordering of a symmetric CSR graph, returns the
+    new to old index order (requires scipy).
+    """
+
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+    flat, row_splits = csr
+    n = len(row_splits) - 1
+
+    graph = csr_matrix((np.ones(len(flat), dtype=np.int8),
+                        np.asarray(flat), np.asarray(row_splits)),
+                       shape=(n, n))
+
+    return np.asarray(reverse_cuthill_mckee(graph, symmetric_mode=True),
+                      dtype=np.int64)
+
+def face_adjacency(tets):
+    """
+    Finds face-adjacent tetrahedrons in O(n log n).
+
+    Returns the CSR arrays (flat, row_splits): the neighbors of tet i are
+    flat[row_splits[i]:row_splits[i+1]].
+    """
+
+    tets = np.asarray(tets)
+
+    first, second, _ = match_faces(tet_faces(tets))
+
+    return pairs_to_csr(first // 4, second // 4, len(tets))
+
+def weld_nodes(nodes, tolerance=None):
+    """
+    Merges coincident nodes. Without a tolerance only exact duplicates are
+    merged (one np.unique pass), otherwise nodes closer than tolerance are
+    clustered with a KD-tree (requires scipy).
+
+    Returns (points, inverse) with nodes ~= points[inverse], points are kept
+    in order of first appearance.
+    """
+
+    nodes = np.asarray(nodes)
+
+    if tolerance:
+        from scipy.spatial import cKDTree
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        pairs = cKDTree(nodes).query_pairs(tolerance, output_type='ndarray')
+        graph = coo_matrix((np.ones(len(pairs), dtype=np.int8),
+                            (pairs[:, 0], pairs[:, 1])),
+                           shape=(len(nodes),)*2)
+        _, labels = connected_components(graph, directed=False)
+        _, index, inverse = np.unique(labels, return_index=True,
+                                      return_inverse=True)
+    else:
+        _, index, inverse = np.unique(nodes, axis=0, return_index=True,
+                                      return_inverse=True)
+
+    #relabel by first appearance
+    order = np.argsort(index)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    return nodes[index[order]], rank[inverse.reshape(-1)]
+
+def shared_faces(tets, labels):
+    """
+    Finds faces shared by tets with different labels (eg. part numbers).
+
+    Returns (faces, tet_a, tet_b): the (m, 3) face nodes and the tets on
+    either side of each interface face.
+    """
+
+    faces = tet_faces(tets)
+    first, second, _ = match_faces(faces)
+
+    labels = np.asarray(labels)
+    tet_a, tet_b = first // 4, second // 4
+    mask = labels[tet_a] != labels[tet_b]
+
+    return faces[first[mask]], tet_a[mask], tet_b[mask]
+
+def signed_volumes(nodes, tets):
+    """
+    Returns the signed volumes of tets (positive when TET_FACES point
+    outwards).
+    """
+
+    c = np.asarray(nodes)[np.asarray(tets)]
+    d = c[:, 1:] - c[:, :1]
+
+    return np.einsum('ij,ij->i', np.cross(d[:, 0], d[:, 1]), d[:, 2])/6.
+
+def boundary_surface(tets, nodes=None):
+    """
+    Finds the faces owned by a single tet.
+
+    Returns (faces, owner, local): the (m, 3) face nodes, the owner tets
+    and the local face index (face j is opposite vertex j). With nodes, the
+    faces of inverted tets are flipped so every face points outwards.
+    """
+
+    faces = tet_faces(tets)
+    _, _, unmatched = match_faces(faces)
+
+    faces = faces[unmatched]
+    owner, local = unmatched // 4, unmatched % 4
+
+    if nodes is not None:
+        inverted = signed_volumes(nodes, np.asarray(tets)[owner]) < 0
+        faces[inverted] = faces[inverted][:, ::-1]
+
+    return faces, owner, local
+
+def _bucket_scatter(make_chunks, n_buckets, out):
+    """
+    Two-pass counting sort of chunked data into (memmapped) out arrays,
+    grouped by bucket. make_chunks() must yield (bucket, columns) with one
+    column per out array, it is called twice.
+
+    Returns the start offset of each bucket (n_buckets + 1).
+    """
+
+    counts = np.zeros(n_buckets, dtype=np.int64)
+    for bucket, _ in make_chunks():
+        counts += np.bincount(bucket, minlength=n_buckets)
+
+    starts = np.zeros(n_buckets + 1, dtype=np.int64)
+    np.cumsum(counts, out=starts[1:])
+    cursor = starts[:-1].copy()
+
+    for bucket, columns in make_chunks():
+        order = np.argsort(bucket, kind='stable')
+        bucket = bucket[order]
+
+        c = np.bincount(bucket, minlength=n_buckets)
+        first = np.zeros(n_buckets, dtype=np.int64)
+        np.cumsum(c[:-1], out=first[1:])
+
+        pos = cursor[bucket] + np.arange(len(bucket)) - first[bucket]
+        for dest, values in zip(out, columns):
+            dest[pos] = values[order]
+        cursor += c
+
+    return starts
+
+def _edges_to_csr_chunked(make_edges, n_edges, n_rows, chunk_size,
+                          directory, name):
+    """
+    Builds disk-backed CSR arrays from chunked directed edges (rows, cols),
+    holding about chunk_size edges in memory at a time.
+    """
+
+    from numpy.lib.format import open_memmap
+
+    n_buckets = max(1, -(-n_edges // chunk_size))
+    width = max(1, -(-n_rows // n_buckets))
+
+    def make_chunks():
+        for rows, cols in make_edges():
+            yield rows // width, (rows, cols)
+
+    path = lambda suffix: os.path.join(directory, name + suffix + '.npy')
+
+    rows_tmp = open_memmap(path('_rows_tmp'), mode='w+', dtype=np.int32, shape=(n_edges,))
+    cols_tmp = open_memmap(path('_cols_tmp'), mode='w+', dtype=np.int32, shape=(n_edges,))
+    starts = _bucket_scatter(make_chunks, n_buckets, (rows_tmp, cols_tmp))
+
+    flat = open_memmap(path('_flat'), mode='w+', dtype=np.int32, shape=(n_edges,))
+    row_splits = open_memmap(path('_row_splits'), mode='w+', dtype=np.int32,
+                             shape=(n_rows + 1,))
+    row_splits[0] = 0
+
+    for b in range(n_buckets):
+        lo, hi = min(b*width, n_rows), min((b+1)*width, n_rows)
+        rows = np.asarray(rows_tmp[starts[b]:starts[b+1]])
+        cols = np.asarray(cols_tmp[starts[b]:starts[b+1]])
+
+        order = np.lexsort((cols, rows))
+        flat[starts[b]:starts[b+1]] = cols[order]
+
+        counts = np.bincount(rows - lo, minlength=hi - lo)
+        row_splits[lo+1:hi+1] = starts[b] + np.cumsum(counts)
+
+    del rows_tmp, cols_tmp
+    os.remove(path('_rows_tmp'))
+    os.remove(path('_cols_tmp'))
+
+    return flat, row_splits
+
+def face_adjacency_chunked(tets, chunk_size=2**20, directory=None):
+    """
+    Out-of-core face_adjacency for (memmapped) tets larger than memory.
+
+    Faces are bucketed on disk by their smallest node, each bucket (about
+    chunk_size faces) is paired in memory, and the CSR arrays are written
+    as .npy memmaps in directory (a temp directory by default).
+    """
+
+    from numpy.lib.format import open_memmap
+
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='pyfea_')
+
+    n = len(tets)
+    step = max(1, chunk_size // 4)
+    chunks = [(start, min(start + step, n)) for start in range(0, n, step)]
+
+    n_nodes = 1 + max([int(np.max(tets[a:b])) for a, b in chunks] or [-1])
+    n_buckets = max(1, -(-4*n // chunk_size))
+    width = max(1, -(-n_nodes // n_buckets))
+
+    def make_faces():
+        for a, b in chunks:
+            keys = face_keys(tet_faces(tets[a:b]))
+            yield keys[:, 0] // width, (keys, np.arange(4*a, 4*b, dtype=np.int32))
+
+    path = lambda name: os.path.join(directory, name + '.npy')
+
+    keys_mm = open_memmap(path('face_keys_tmp'), mode='w+', dtype=np.int32, shape=(4*n, 3))
+    ids_mm = open_memmap(path('face_ids_tmp'), mode='w+', dtype=np.int32, shape=(4*n,))
+    starts = _bucket_scatter(make_faces, n_buckets, (keys_mm, ids_mm))
+
+    #an interior face is shared by two tets, at most 2n pairs
+    pairs = open_memmap(path('face_pairs_tmp'), mode='w+', dtype=np.int32, shape=(2*n, 2))
+    n_pairs = 0
+    for b in range(n_buckets):
+        keys = np.asarray(keys_mm[starts[b]:starts[b+1]])
+        ids = np.asarray(ids_mm[starts[b]:starts[b+1]])
+
+        first, second, _ = match_faces(keys)
+        pairs[n_pairs:n_pairs+len(first), 0] = ids[first] // 4
+        pairs[n_pairs:n_pairs+len(first), 1] = ids[second] // 4
+        n_pairs += len(first)
+
+    del keys_mm, ids_mm
+    os.remove(path('face_keys_tmp'))
+    os.remove(path('face_ids_tmp'))
+
+    def make_edges():
+        for a in range(0, n_pairs, chunk_size):
+            p = np.asarray(pairs[a:min(a + chunk_size, n_pairs)])
+            yield (np.concatenate([p[:, 0], p[:, 1]]),
+                   np.concatenate([p[:, 1], p[:, 0]]))
+
+    csr = _edges_to_csr_chunked(make_edges, 2*n_pairs, n, chunk_size,
+                                directory, 'tet_to_tet')
+
+    del pairs
+    os.remove(path('face_pairs_tmp'))
+
+    return csr
+
+def node_to_tet_chunked(tets, n_nodes, chunk_size=2**20, directory=None):
+    """
+    Out-of-core node-to-tet CSR arrays (see face_adjacency_chunked).
+    """
+
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='pyfea_')
+
+    n = len(tets)
+    step = max(1, chunk_size // 4)
+
+    def make_edges():
+        for a in range(0, n, step):
+            b = min(a + step, n)
+            yield (np.asarray(tets[a:b]).ravel(),
+                   np.repeat(np.arange(a, b, dtype=np.int32), 4))
+
+    return _edges_to_csr_chunked(make_edges, 4*n, n_nodes, chunk_size,
+                                 directory, 'node_to_tet')
+
+class MeshTopology:
+    """
+    Connectivity of a tet mesh, every map stored as CSR arrays
+    (flat, row_splits) with int32 indices. Each map is built on first
+    access and kept.
+
+    Faces are numbered interior faces first, then boundary faces.
+    """
+
+    tets = None
+    n_tets = 0
+    n_nodes = 0
+
+    chunk_size = None
+    directory = None
+
+    def __init__(self, tets, n_nodes=None, chunk_size=None, directory=None):
+        """
+        Wraps the (n, 4) tets array, n_nodes defaults to the largest node
+        index + 1.
+
+        With a chunk_size, tet-to-tet and node-to-tet are built out-of-core
+        as memmaps in directory (see face_adjacency_chunked).
+        """
+
+        self.tets = tets if isinstance(tets, np.memmap) else np.asarray(tets)
+        self.n_tets = len(self.tets)
+
+        assert self.n_tets*4 < 2**31, 'mesh too large for int32 indices'
+
+        if n_nodes is None:
+            n_nodes = int(self.tets.max()) + 1 if self.n_tets else 0
+        self.n_nodes = n_nodes
+
+        self.chunk_size = chunk_size
+        self.directory = directory
+
+        self._cache = {}
+
+    @classmethod
+    def concatenate(cls, topologies, tets, n_nodes=None, chunk_size=None,
+                    directory=None):
+        """
+        Topology of disjoint meshes stacked in order (tets holds the stacked
+        tets). Cached tet-to-tet and node-to-tet maps are rebased instead of
+        rebuilt, face tables are rebuilt on access.
+        """
+
+        topology = cls(tets, n_nodes, chunk_size, directory)
+        tet_offsets = np.cumsum([0] + [t.n_tets for t in topologies])
+
+        for name in ['tet_to_tet', 'node_to_tet']:
+            if all(name in t._cache for t in topologies):
+                topology._cache[name] = concatenate_csr(
+                    [t._cache[name] for t in topologies], tet_offsets[:-1])
+
+        return topology
+
+    @classmethod
+    def from_arrays(cls, tets, n_nodes, arrays, chunk_size=None, directory=None):
+        """
+        Rebuilds a topology from the output of to_arrays (eg. loaded from
+        disk), missing maps are built on access as usual.
+        """
+
+        topology = cls(tets, n_nodes, chunk_size, directory)
+
+        for name in arrays:
+            if name.endswith('_flat'):
+                base = name[:-len('_flat')]
+                topology._cache[base] = (arrays[name], arrays[base + '_row_splits'])
+            elif name == 'n_interior_faces':
+                topology._cache[name] = int(arrays[name])
+            elif not name.endswith('_row_splits'):
+                topology._cache[name] = arrays[name]
+
+        return topology
+
+    def permute(self, tets, node_order=None, tet_order=None):
+        """
+        Topology of the renumbered mesh (tets holds the renumbered tets).
+        Cached maps are permuted instead of rebuilt, face numbering is kept.
+        """
+
+        n_nodes = self.n_nodes
+        topology = type(self)(tets, n_nodes, self.chunk_size, self.directory)
+
+        node_order = np.arange(n_nodes) if node_order is None else np.asarray(node_order)
+        tet_order = np.arange(self.n_tets) if tet_order is None else np.asarray(tet_order)
+
+        node_inverse = np.empty(n_nodes, dtype=np.int32)
+        node_inverse[node_order] = np.arange(n_nodes)
+        tet_inverse = np.empty(self.n_tets, dtype=np.int32)
+        tet_inverse[tet_order] = np.arange(self.n_tets)
+
+        cache = self._cache
+        new = topology._cache
+
+        if 'tet_to_tet' in cache:
+            new['tet_to_tet'] = permute_csr(cache['tet_to_tet'], tet_order, tet_inverse)
+        if 'node_to_tet' in cache:
+            new['node_to_tet'] = permute_csr(cache['node_to_tet'], node_order, tet_inverse)
+        if 'face_nodes' in cache:
+            new['face_nodes'] = node_inverse[cache['face_nodes']]
+            new['n_interior_faces'] = cache['n_interior_faces']
+
+            flat, row_splits = cache['tet_to_face']
+            new['tet_to_face'] = (np.asarray(flat).reshape(-1, 4)[tet_order].ravel(),
+                                  row_splits)
+
+            #keeps the owner order of each face (face nodes follow the first)
+            flat, row_splits = cache['face_to_tet']
+            new['face_to_tet'] = (tet_inverse[flat], row_splits)
+
+        return topology
+
+    def to_arrays(self):
+        """
+        Returns the maps built so far as a flat dict of arrays (for saving).
+        """
+
+        arrays = {}
+        for name, value in self._cache.items():
+            if isinstance(value, tuple):
+                arrays[name + '_flat'], arrays[name + '_row_splits'] = value
+            else:
+                arrays[name] = np.asarray(value)
+
+        return arrays
+
+    def _get(self, name, builder):
+        """
+        Returns a cached field, building it on first access.
+        """
+
+        if name not in self._cache:
+            self._cache.update(builder())
+        return self._cache[name]
+
+    def _build_faces(self):
+        """
+        Pairs tet faces, builds the face, tet-to-face and tet-to-tet tables.
+        """
+
+        faces = tet_faces(self.tets)
+        first, second, unmatched = match_faces(faces)
+
+        n_interior = len(first)
+        n_faces = n_interior + len(unmatched)
+
+        tet_face = np.empty(len(faces), dtype=np.int32)
+        tet_face[first] = np.arange(n_interior)
+        tet_face[second] = np.arange(n_interior)
+        tet_face[unmatched] = np.arange(n_interior, n_faces)
+
+        face_flat = np.empty(2*n_interior + len(unmatched), dtype=np.int32)
+        face_flat[0:2*n_interior:2] = first // 4
+        face_flat[1:2*n_interior:2] = second // 4
+        face_flat[2*n_interior:] = unmatched // 4
+
+        face_splits = np.empty(n_faces + 1, dtype=np.int32)
+        face_splits[:n_interior+1] = np.arange(0, 2*n_interior + 1, 2)
+        face_splits[n_interior+1:] = 2*n_interior + np.arange(1, len(unmatched) + 1)
+
+        return {'face_nodes': faces[np.concatenate([first, unmatched])].astype(np.int32),
+                'n_interior_faces': n_interior,
+                'tet_to_face': (tet_face,
+                                np.arange(0, len(faces) + 1, 4, dtype=np.int32)),
+                'face_to_tet': (face_flat, face_splits),
+                'tet_to_tet': pairs_to_csr(first // 4, second // 4, self.n_tets)}
+
+    def _build_nodes(self):
+        """
+        Builds the node-to-tet table.
+        """
+
+        flat_tets = self.tets.ravel()
+        order = np.argsort(flat_tets, kind='stable')
+
+        counts = np.bincount(flat_tets, minlength=self.n_nodes)
+        row_splits = np.zeros(self.n_nodes + 1, dtype=np.int32)
+        np.cumsum(counts, out=row_splits[1:])
+
+        return {'node_to_tet': ((order // 4).astype(np.int32), row_splits)}
+
+    @property
+    def tet_to_tet(self):
+        """
+        Face neighbors of each tet.
+        """
+
+        if self.chunk_size and 'tet_to_tet' not in self._cache:
+            self._cache['tet_to_tet'] = face_adjacency_chunked(
+                    self.tets, self.chunk_size, self.directory)
+
+        return self._get('tet_to_tet', self._build_faces)
+
+    @property
+    def tet_to_face(self):
+        """
+        Faces of each tet (always 4, face j is opposite vertex j).
+        """
+        return self._get('tet_to_face', self._build_faces)
+
+    @property
+    def face_to_tet(self):
+        """
+        Tets owning each face (2 for interior faces, 1 for boundary faces).
+        """
+        return self._get('face_to_tet', self._build_faces)
+
+    @property
+    def node_to_tet(self):
+        """
+        Tets using each node.
+        """
+
+        if self.chunk_size and 'node_to_tet' not in self._cache:
+            self._cache['node_to_tet'] = node_to_tet_chunked(
+                    self.tets, self.n_nodes, self.chunk_size, self.directory)
+
+        return self._get('node_to_tet', self._build_nodes)
+
+    @property
+    def face_nodes(self):
+        """
+        (n_faces, 3) node indices of each face.
+        """
+        return self._get('face_nodes', self._build_faces)
+
+    @property
+    def n_interior_faces(self):
+        """
+        Number of faces shared by two tets.
+        """
+        return self._get('n_interior_faces', self._build_faces)
+
+    @property
+    def n_faces(self):
+        """
+        Total number of unique faces.
+        """
+        return len(self.face_nodes)
+
+    @property
+    def boundary_faces(self):
+        """
+        Indices of the faces owned by a single tet.
+        """
+        return np.arange(self.n_interior_faces, self.n_faces, dtype=np.int32)
+
+    @property
+    def boundary_tets(self):
+        """
+        Owner tet of each boundary face.
+        """
+
+        flat, _ = self.face_to_tet
+        return flat[2*self.n_interior_faces:]
+
+    @property
+    def boundary_local(self):
+        """
+        Local index (face j is opposite vertex j) of each boundary face in
+        its owner tet.
+        """
+
+        flat, _ = self.tet_to_face
+        local = np.asarray(flat).reshape(-1, 4)[self.boundary_tets]
+        return np.argmax(local == self.boundary_faces[:, None], axis=1)
+
+    def neighbors(self, index):
+        """
+        Returns the face neighbors of a tet.
+        """
+
+        flat, row_splits = self.tet_to_tet
+        return flat[row_splits[index]:row_splits[index+1]]
@@ -68,6 +68,10 @@ class gmsh_interface(interface_base):
     
     filetypes=['stl', 'step', 'stp']
     
+    neighbors = None
+    boundary_faces = None
+    boundary_tets = None
+    
     def __init__(self, name='pyfea'):
         """
         Initializes the gmsh instance.
@@ -130,18 +134,20 @@ class gmsh_interface(interface_base):
         gmsh.option.setNumber("Mesh.CharacteristicLengthMin", minlength);
         gmsh.option.setNumber("Mesh.CharacteristicLengthMax", maxlength);
         
-    def gen_mesh_from_surf(self, input_geo):
+    def gen_mesh_from_surf(self, input_geo, algorithm=6, angle=40):
         """
-        Generates a mesh from a surface mesh or file.
+        Generates a mesh from a surface mesh or file (algorithm is the gmsh
+        2d meshing algorithm, angle the surface classification angle in
+        degrees).
         """
         
         gmsh = self.gmsh
         
         if isinstance(input_geo, SurfaceMesh): input_geo = input_geo.gen_stl()
         
-        gmsh.option.setNumber("Mesh.Algorithm", 6);
+        gmsh.option.setNumber("Mesh.Algorithm", algorithm);
         gmsh.merge(input_geo)
-        gmsh.model.mesh.classifySurfaces(40*math.pi/180., True, True)
+        gmsh.model.mesh.classifySurfaces(angle*math.pi/180., True, True)
 
         # create a geometry (through reparametrization) for all discrete curves and
         # discrete surfaces
@@ -159,42 +165,41 @@ class gmsh_interface(interface_base):
     
     def get_face_neighbors(self, verbose=False):
         """
+        Finds face neighbors of the tets from gmsh face nodes by sorting
+        (see pyfea.fea.topology.match_faces), based on
         https://gitlab.onelab.info/gmsh/gmsh/blob/master/demos/api/neighbors.py
+        
+        Returns CSR arrays (flat, row_splits) in mesh order (same tet order
+        as extract_geometry). Also sets boundary_faces, the (m, 3) node
+        indices of faces owned by a single tet, and boundary_tets, their
+        owner tets.
         """
         
+        from pyfea.fea.topology import match_faces, pairs_to_csr
+        
         gmsh = self.gmsh
         
         if verbose: print("--- getting tets and face nodes")
-        tets, _ = gmsh.model.mesh.getElementsByType(4)
-#        tets = gmsh.model.mesh.getElements(3)
+        points, lookup = self._get_nodes()
+        tets = self._get_tets(lookup)
         fnodes = gmsh.model.mesh.getElementFaceNodes(4, 3)
+        faces = lookup[np.asarray(fnodes, dtype=np.int64).reshape(-1, 3)]
+        
+        if verbose: print("--- pairing faces")
+        first, second, unmatched = match_faces(faces)
+        
+        if verbose: print("--- building neighbors by face")
+        self.neighbors = pairs_to_csr(first // 4, second // 4, len(tets))
+        
+        #node indices consistent with the compacted extract_geometry points
+        _, index = self._compact_index(len(points), tets)
+        self.boundary_faces = index[faces[unmatched]]
+        self.boundary_tets = unmatched // 4
         
-        if verbose: print("--- computing face x tet incidence")
-        faces = []
-        fxt = {}
-        for i in range(0, len(fnodes), 3):
-            f = tuple(sorted(fnodes[i:i+3]))
-            faces.append(f)
-            t = tets[int(i/12)]
-            if not f in fxt:
-                fxt[f] = [t]
-            else:
-                fxt[f].append(t)
-        
-        if verbose: print("--- computing neighbors by face")
-        txt = {}
-        for i in range(0, len(faces)):
-            f = faces[i]
-            t = tets[int(i/4)]
-            if not t in txt:
-                txt[t] = set()
-            for tt in fxt[f]:
-                if tt != t:
-                    txt[t].add(tt)
-        
-        if verbose: print("--- done: neighbors by face =", txt)
-        
-        return tt
+        if verbose: print("--- done: " + str(len(first)) + " interior faces, "
+                          + str(len(unmatched)) + " boundary faces")
+        
+        return self.neighbors
 
     def display_mesh(self):
         """
@@ -205,55 +210,90 @@ class gmsh_interface(interface_base):
         
         gmsh.fltk.run()
         
-    def extract_geometry(self):
+    def _get_nodes(self):
         """
-        Extracts the geometry from gmsh and returns it in pyfea format.
+        Returns all mesh nodes as (points, lookup), lookup maps gmsh node
+        tags (not necessarily contiguous or starting at 1) to point indices.
         """
         
         gmsh = self.gmsh
         
-        #point cloud
-        _, points, _ = gmsh.model.mesh.getNodes()
-        self.points = points.reshape(( int(len(points)/3),3))
+        tags, points, _ = gmsh.model.mesh.getNodes()
+        tags = np.asarray(tags, dtype=np.int64)
+        
+        lookup = np.full(tags.max() + 1 if len(tags) else 0, -1, dtype=np.int64)
+        lookup[tags] = np.arange(len(tags))
+        
+        return np.asarray(points, dtype=np.float64).reshape(-1, 3), lookup
+    
+    def _get_tets(self, lookup, tag=-1):
+        """
+        Returns the (n, 4) tets of a volume (all volumes by default) as
+        indices into the points of _get_nodes.
+        """
+        
+        gmsh = self.gmsh
+        
+        _, node_tags = gmsh.model.mesh.getElementsByType(4, tag)
+        
+        return lookup[np.asarray(node_tags, dtype=np.int64).reshape(-1, 4)]
+    
+    @staticmethod
+    def _compact_index(n_points, tets):
+        """
+        Returns (used, index): the mask of points referenced by tets and
+        their new indices, linear time.
+        """
         
-        elements = gmsh.model.mesh.getElements()
-        elements = elements[2][list(elements[0]).index(4)]
-        self.elements = elements.reshape(int(len(elements)/4),4)-1
+        used = np.zeros(n_points, dtype=bool)
+        used[tets.ravel()] = True
+        
+        return used, np.cumsum(used) - 1
+    
+    @classmethod
+    def _compact(cls, points, tets):
+        """
+        Keeps only the points referenced by tets (in their original order)
+        and renumbers the tets.
+        """
+        
+        used, index = cls._compact_index(len(points), tets)
+        
+        return points[used], index[tets]
+        
+    def extract_geometry(self):
+        """
+        Extracts the geometry from gmsh and returns it in pyfea format.
+        """
+        
+        points, lookup = self._get_nodes()
+        
+        self.points, self.elements = self._compact(points, self._get_tets(lookup))
         
         return self.points, self.elements
     
     def extract_assembly_geometry(self, entities = [(3,1)]):
         """
         Extracts the geometry from gmsh and returns it in pyfea format.
+        
+        Each volume entity becomes a Part holding only its own nodes.
         """
         
         from pyfea.fea.geometry import Part, Assembly
         
-        gmsh = self.gmsh
+        #point cloud and tag lookup, shared by every part
+        points, lookup = self._get_nodes()
         
         parts = []
-        
-        #point cloud
-        _, points, _ = gmsh.model.mesh.getNodes()
-        points = points.reshape(( int(len(points)/3),3))
-        
-        for entity in entities:
-            
-            dim = entity[0]
-            tag = entity[1]
+        for dim, tag in entities:
             
-            elements = gmsh.model.mesh.getElements(dim, tag)
-            elements = elements[2][list(elements[0]).index(4)]
-            elements = elements.reshape(int(len(elements)/4),4)-1
-            
-#            return points, elements
+            part_points, part_tets = self._compact(points, self._get_tets(lookup, tag))
             
             part = Part()
-            part.add_geometry(points, elements)
+            part.add_geometry(part_points, part_tets)
                 
             parts.append(part)
             
-            
         assembly = Assembly(parts)
         
         return assembly
@@ -292,15 +332,16 @@ class tetgen_interface(interface_base):
     def gen_mesh_from_surf(self, raw_input = None,
                            filename=None, 
                            tri=None, points=None, 
-                           surface_mesh=None):
+                           surface_mesh=None, **switches):
         """
-        Generates a mesh from a surface mesh or file.
+        Generates a mesh from a surface mesh or file, switches are passed to
+        TetGen.tetrahedralize.
         """
         
         if filename:
             self.check_compatibility(filename)
         
-        from stl import mesh
+        from pyfea.tools.stl_io import read_stl
         import tetgen
         
         #put rawinput in correct place
@@ -312,12 +353,7 @@ class tetgen_interface(interface_base):
         assert (filename or (tri and points) or surface_mesh), 'No input geometry specified'
         
         if filename:
-            mesh = mesh.Mesh.from_file(filename)
-            points = np.unique(mesh.points.reshape(mesh.points.shape[0]*3, 3), axis=0)
-            tri = [[points.tolist().index(x[0:3].tolist()),
-                    points.tolist().index(x[3:6].tolist()),
-                    points.tolist().index(x[6:9].tolist())]
-                   for x in mesh.points] 
+            points, tri = read_stl(filename)
     
         elif surface_mesh:
             points = surface_mesh.points
@@ -332,7 +368,7 @@ class tetgen_interface(interface_base):
         
         tet = tetgen.TetGen(mesh)
         tet.make_manifold()
-        tet.tetrahedralize()
+        tet.tetrahedralize(**switches)
         
         grid = tet.grid
         
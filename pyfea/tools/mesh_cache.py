@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed on-disk cache for generated tet meshes, so unchanged
+geometry is not re-meshed on every run.
+"""
+
+import os
+import hashlib
+import numpy as np
+
+#bump when the stored layout changes to ignore old entries
+CACHE_VERSION = 1
+
+def cache_enabled():
+    """
+    Parses the PYFEA_MESH_CACHE environment variable (1/true/yes/on or
+    0/false/no/off, unset means off).
+    """
+
+    value = os.environ.get('PYFEA_MESH_CACHE', '').strip().lower()
+
+    if value in ['1', 'true', 'yes', 'on']:
+        return True
+    if value not in ['', '0', 'false', 'no', 'off']:
+        print('WARNING: PYFEA_MESH_CACHE=' + value + ' not understood, mesh cache disabled.')
+    return False
+
+class MeshCache:
+    """
+    Stores nodes, tets and topology arrays of meshed surfaces as
+    uncompressed .npz files keyed on a hash of the meshing inputs.
+    Least recently used entries are evicted above max_size bytes.
+
+    The default directory can be set with the PYFEA_MESH_CACHE_DIR
+    environment variable (defaults to ~/.cache/pyfea/meshes). The cache is
+    used by default in EntityMesh.gen_mesh_from_surf and Assembly.mesh_parts
+    when PYFEA_MESH_CACHE is on (see cache_enabled).
+    """
+
+    directory = None
+    max_size = None
+
+    def __init__(self, directory=None, max_size=2*1024**3):
+        """
+        Initializes the cache directory and size limit (bytes).
+        """
+
+        if directory is None:
+            directory = os.environ.get('PYFEA_MESH_CACHE_DIR',
+                                       os.path.join(os.path.expanduser('~'),
+                                                    '.cache', 'pyfea', 'meshes'))
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def key(surface_mesh, engine, element_size, **options):
+        """
+        Hashes the surface data, meshing engine, element size and engine
+        options.
+        """
+
+        h = hashlib.sha256()
+
+        for arr in [surface_mesh.points, surface_mesh.tri]:
+            arr = np.ascontiguousarray(arr)
+            h.update(str((arr.dtype.str, arr.shape)).encode())
+            h.update(arr.tobytes())
+
+        h.update(repr((CACHE_VERSION, engine, tuple(element_size),
+                       sorted(options.items()))).encode())
+
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key):
+        """
+        Returns the stored arrays (dict) or None on a cache miss.
+        """
+
+        path = self._path(key)
+
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            #partially written/corrupt entry, treat as a miss
+            return None
+
+        #mark as recently used
+        os.utime(path)
+
+        return arrays
+
+    def store(self, key, nodes, tets, topology=None):
+        """
+        Saves a mesh (and its topology if given) then evicts old entries.
+        """
+
+        arrays = {'nodes': np.asarray(nodes), 'tets': np.asarray(tets)}
+        if topology is not None:
+            arrays.update({'topology_' + name: value for name, value
+                           in topology.to_arrays().items()})
+
+        path = self._path(key)
+        tmp = path + '.' + str(os.getpid()) + '.tmp'
+
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits max_size.
+        """
+
+        if self.max_size is None:
+            return
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(entry[1] for entry in entries)
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """
+        Removes every cached mesh.
+        """
+
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.directory, name))
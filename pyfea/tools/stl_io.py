@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized STL reading (binary and ASCII) and binary writing, no
+per-vertex python loops.
+"""
+
+import os
+import numpy as np
+
+#binary STL facet record
+STL_DTYPE = np.dtype([('normals', '<f4', (3,)),
+                      ('vectors', '<f4', (3, 3)),
+                      ('attr', '<u2')])
+
+def is_binary_stl(filename):
+    """
+    Checks whether an stl file is binary. Binary headers may also start with
+    "solid", so the facet count is checked against the file size (some
+    exporters append trailing bytes).
+    """
+
+    size = os.path.getsize(filename)
+    if size < 84:
+        return False
+
+    with open(filename, 'rb') as f:
+        header = f.read(80)
+        n = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+
+    expected = 84 + n*STL_DTYPE.itemsize
+
+    if size == expected:
+        return True
+
+    return not header.lstrip().startswith(b'solid') and size > expected
+
+def read_stl_vertices(filename, chunk_size=2**20):
+    """
+    Reads the raw (n, 3, 3) facet vertices of an stl file, chunk_size facets
+    (binary) or bytes (ASCII) at a time.
+    """
+
+    if is_binary_stl(filename):
+        with open(filename, 'rb') as f:
+            f.seek(80)
+            n = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+
+            vectors = np.empty((n, 3, 3), dtype=np.float32)
+            for start in range(0, n, chunk_size):
+                chunk = np.fromfile(f, dtype=STL_DTYPE,
+                                    count=min(chunk_size, n-start))
+                vectors[start:start+len(chunk)] = chunk['vectors']
+
+        return vectors
+
+    chunks = []
+    with open(filename, 'rb') as f:
+        while True:
+            lines = f.readlines(chunk_size)
+            if not lines:
+                break
+            coords = [l.split()[1:4] for l in lines
+                      if l.lstrip().startswith(b'vertex')]
+            if coords:
+                chunks.append(np.array(coords, dtype=np.float32))
+
+    if not chunks:
+        return np.empty((0, 3, 3), dtype=np.float32)
+
+    return np.concatenate(chunks).reshape(-1, 3, 3)
+
+def weld_vertices(vertices, tolerance=None):
+    """
+    Deduplicates (n, 3) vertices (see pyfea.fea.topology.weld_nodes): exact
+    duplicates in one np.unique pass, or with a tolerance, vertices closer
+    than tolerance clustered with a KD-tree (requires scipy).
+
+    Returns (points, inverse) with vertices ~= points[inverse].
+    """
+
+    from pyfea.fea.topology import weld_nodes
+
+    return weld_nodes(vertices, tolerance)
+
+def read_stl(filename, tolerance=None, chunk_size=2**20):
+    """
+    Reads an stl file and returns (points, tri) with shared vertices merged.
+
+    If a weld tolerance is given, facets collapsed by the welding are
+    dropped.
+    """
+
+    vectors = read_stl_vertices(filename, chunk_size=chunk_size)
+
+    points, inverse = weld_vertices(vectors.reshape(-1, 3), tolerance)
+    tri = inverse.reshape(-1, 3)
+
+    if tolerance:
+        keep = (tri[:, 0] != tri[:, 1]) \
+             & (tri[:, 1] != tri[:, 2]) \
+             & (tri[:, 0] != tri[:, 2])
+        tri = tri[keep]
+
+    return points, tri
+
+def facet_normals(vectors):
+    """
+    Computes unit normals of (n, 3, 3) facets in bulk (zero for degenerate
+    facets).
+    """
+
+    normals = np.cross(vectors[:, 1] - vectors[:, 0],
+                       vectors[:, 2] - vectors[:, 0])
+    norm = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, norm, out=normals, where=norm > 0)
+
+    return normals
+
+def write_stl(filename, points, tri, header=b'pyfea'):
+    """
+    Writes a binary stl from points and triangle indices, building every
+    facet with one fancy-indexing operation into a preallocated record
+    buffer.
+    """
+
+    tri = np.asarray(tri)
+
+    data = np.zeros(len(tri), dtype=STL_DTYPE)
+    data['vectors'] = np.asarray(points, dtype=np.float32)[tri]
+    data['normals'] = facet_normals(data['vectors'])
+
+    with open(filename, 'wb') as f:
+        f.write(header[:80].ljust(80, b' '))
+        f.write(np.uint32(len(data)).astype('<u4').tobytes())
+        data.tofile(f)
+
+    return filename
@@ -17,16 +17,17 @@ pyfea_data={}
 def drawtets(nodes, tets, values):
     
     try:
+        from pyfea.fea.topology import boundary_surface
+        
         nodes = np.array(nodes)
         tets = np.array(tets)
         values = np.array(values)
         
     #    assert tets.shape[1] == 4
         
-        #tets helper
-        t_h = np.hstack([tets,tets[:,:2]])
-        tri = np.vstack([t_h[:,0:3],t_h[:,1:4],t_h[:,2:5],t_h[:,3:6]])
-        tri = np.rot90(tri,-1)
+        #only the outer surface is visible, one triangle per boundary face
+        tri, owners, _ = boundary_surface(tets, nodes)
+        tri = tri.T
         
         return go.Mesh3d(
             x=nodes[:,0].flatten(), #x=[0, 1, 2, 0],
@@ -36,13 +37,13 @@ def drawtets(nodes, tets, values):
             colorscale=[[0, 'gold'], 
                         [0.5, 'mediumturquoise'], 
                         [1, 'magenta']],
-            # Intensity of each vertex, which will be interpolated and color-coded
-            intensity=np.rot90(np.vstack([values]*4),-1).flatten(), #intensity=[0, 0.33, 0.66, 1],
+            # Value of the tet owning each triangle
+            intensity=values[owners],
+            intensitymode='cell',
             # i, j and k give the vertices of triangles
-            # here we represent the 4 triangles of the tetrahedron surface
-            i=tri[0].flatten(),    #i=[0, 0, 0, 1],
-            j=tri[1].flatten(),    #j=[1, 2, 3, 2],
-            k=tri[2].flatten(),    #k=[2, 3, 1, 3],
+            i=tri[0],
+            j=tri[1],
+            k=tri[2],
             name='tets',
             showscale=True
         )
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Thermal_Conduction time integration at the default timestep.
+"""
+
+import types
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('scipy')
+pytest.importorskip('pyvista')
+pytest.importorskip('meshio')
+
+from pyfea.fea.geometry import Part, Assembly
+from pyfea.fea.materials import Material
+from pyfea.fea.simulation import Thermal_Conduction
+
+def cube_mesh(n):
+    """
+    Unit cube split into n^3 cells of 6 tets.
+    """
+
+    g = np.linspace(0, 1, n + 1)
+    nodes = np.stack(np.meshgrid(g, g, g, indexing='ij'), axis=-1).reshape(-1, 3)
+    index = np.arange((n + 1)**3).reshape(n + 1, n + 1, n + 1)
+
+    i, j, k = [a.ravel() for a in np.meshgrid(*[np.arange(n)]*3, indexing='ij')]
+    v = np.stack([index[i, j, k], index[i+1, j, k], index[i+1, j+1, k],
+                  index[i, j+1, k], index[i, j, k+1], index[i+1, j, k+1],
+                  index[i+1, j+1, k+1], index[i, j+1, k+1]], axis=1)
+
+    tets = [np.stack([v[:, 0], v[:, a], v[:, b], v[:, c]], axis=1)
+            for a, b, c in [(1, 2, 6), (2, 3, 6), (3, 7, 6),
+                            (7, 4, 6), (4, 5, 6), (5, 1, 6)]]
+
+    return nodes, np.concatenate(tets)
+
+def run(scheme, steps=30, **options):
+    """
+    Steps a steel block at 100 next to an aluminium block at 0 with the
+    default timestep, returns the (steps + 1, n_nodes) nodal temperatures.
+    """
+
+    nodes, tets = cube_mesh(6)
+
+    parts = []
+    for offset, material in [(0, Material('steel', k=46.6, Cp=475., density=7850.)),
+                             (1, Material('alu', k=205., Cp=900., density=2700.))]:
+        part = Part(material=material)
+        part.add_geometry(nodes + [offset, 0, 0], tets)
+        parts.append(part)
+    assembly = Assembly(parts)
+
+    T = np.where(assembly.tetpart == 0, 100., 0.)
+    simulation = types.SimpleNamespace(assembly=assembly,
+                                       variables=pd.DataFrame({'T': T}))
+    effect = Thermal_Conduction(simulation, scheme=scheme, **options)
+
+    history = [effect.nodal_temperatures().copy()]
+    for _ in range(steps):
+        effect.calculate(effect.get_timestep())
+        history.append(effect.T_nodes.copy())
+
+    return np.array(history)
+
+def turnarounds(history, tolerance=1e-3):
+    """
+    Largest number of sign changes of the temperature increments of a node.
+    """
+
+    d = np.diff(history, axis=0)
+    flips = (d[1:]*d[:-1] < 0) \
+          & (np.minimum(np.abs(d[1:]), np.abs(d[:-1])) > tolerance)
+
+    return flips.sum(axis=0).max()
+
+@pytest.mark.parametrize('scheme', ['backward_euler', 'crank_nicolson'])
+def test_no_oscillations_at_default_timestep(scheme):
+    history = run(scheme)
+
+    #a node may heat up then cool down once, but never alternate
+    assert turnarounds(history) <= 1
+
+    #temperatures stay within the initial range
+    assert history.min() > -1e-6 and history.max() < 100 + 1e-6
+
+def test_crank_nicolson_oscillates_without_startup():
+    assert turnarounds(run('crank_nicolson', startup_steps=0)) > 1